@@ -1,5 +1,7 @@
+import os
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 from apify_client import ApifyClient
@@ -35,6 +37,12 @@ ACTOR_BASE = {
     "maxResultsPerKeyword": 30000,
 }
 
+# Solo los campos del actor que usa build_row (el resto no viaja por la red)
+DATASET_FIELDS = ["Date", "Title", "Description", "Source Name", "Link"]
+
+# Runs del actor en paralelo (uno por país)
+MAX_ACTOR_WORKERS = int(os.getenv("MAX_ACTOR_WORKERS", str(len(COUNTRIES))))
+
 # ─────────────────────────────────────────────
 # Helpers de transformación
 # ─────────────────────────────────────────────
@@ -109,7 +117,7 @@ def run_actor_for_country(client: ApifyClient,
                  ).call(run_input=actor_input)
     dataset_id = run["defaultDatasetId"]
     print(f"    Run ID: {run['id']} | Dataset: {dataset_id}")
-    items = list(client.dataset(dataset_id).iterate_items())
+    items = list(client.dataset(dataset_id).iterate_items(fields=DATASET_FIELDS, clean=True))
     print(f"    Items recibidos: {len(items)}")
     return items
 
@@ -118,14 +126,23 @@ def run_actor_for_country(client: ApifyClient,
 # Google Sheets
 # ─────────────────────────────────────────────
 
+LINK_COL = 5   # columna E (link) del Sheet
+
+
 def open_existing_sheet(gc: gspread.Client) -> gspread.Worksheet:
     """Abre la pestaña existente sin tocar encabezados ni datos previos."""
     sh = gc.open_by_key(GOOGLE_SHEET_ID)
     ws = sh.worksheet(SHEET_TAB_NAME)
-    print(f"  Sheet abierto: '{SHEET_TAB_NAME}' | filas actuales: {len(ws.get_all_values())}")
+    print(f"  Sheet abierto: '{SHEET_TAB_NAME}'")
     return ws
 
 
+def load_existing_links(ws: gspread.Worksheet) -> set[str]:
+    """Lee solo la columna de links (E) para deduplicar sin bajar toda la hoja."""
+    links = ws.col_values(LINK_COL)
+    return {link.strip() for link in links[1:] if link and link.strip()}
+
+
 def append_rows_batched(ws: gspread.Worksheet,
                          rows: list[list], batch: int = 500):
     total = len(rows)
@@ -157,18 +174,44 @@ def main():
     print(f"🌎  Países    : {[c[1] for c in COUNTRIES]}")
     print(f"📅  scraped_at: {scraped_ts}\n")
 
-    ws            = open_existing_sheet(gc)
-    total_written = 0
-
-    for country_label, country_name in COUNTRIES:
-        items = run_actor_for_country(apify_client, country_label, country_name)
+    ws             = open_existing_sheet(gc)
+    existing_links = load_existing_links(ws)
+    print(f"  Links ya cargados: {len(existing_links)}")
+    total_written  = 0
+
+    # Los runs del actor son independientes: se lanzan todos a la vez.
+    # La escritura al Sheet sigue siendo secuencial, en el orden de COUNTRIES.
+    with ThreadPoolExecutor(max_workers=MAX_ACTOR_WORKERS) as pool:
+        futures = [
+            pool.submit(run_actor_for_country, apify_client, label, name)
+            for label, name in COUNTRIES
+        ]
+
+    for (country_label, country_name), future in zip(COUNTRIES, futures):
+        try:
+            items = future.result()
+        except Exception as e:
+            print(f"    ✖  Falló el actor para {country_name}: {e}")
+            continue
 
         if not items:
             print(f"    ⚠  Sin resultados para {country_name}.")
             continue
 
-        rows = [build_row(item, country_name, scraped_ts) for item in items]
-        print(f"    Escribiendo {len(rows)} filas ...")
+        # Solo filas cuyo link no está en el Sheet (ni repetido en esta corrida)
+        rows = []
+        for item in items:
+            link = (item.get("Link") or "").strip()
+            if not link or link in existing_links:
+                continue
+            existing_links.add(link)
+            rows.append(build_row(item, country_name, scraped_ts))
+
+        if not rows:
+            print(f"    Sin filas nuevas para {country_name}.")
+            continue
+
+        print(f"    Escribiendo {len(rows)} filas nuevas (de {len(items)}) ...")
         append_rows_batched(ws, rows)
         total_written += len(rows)
 
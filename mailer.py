@@ -7,8 +7,10 @@ import pytz
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
 import smtplib
+import ssl
 from email.mime.text import MIMEText
 import re
+import html
 
 # === Configuración Google Sheets ===
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
@@ -16,7 +18,7 @@ SPREADSHEET_ID = "1du5Cx3pK1LnxoVeBXTzP-nY-OSvflKXjJZw2Lq-AE14"
 
 creds_dict = json.loads(os.getenv("GOOGLE_CREDENTIALS"))
 creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-service = build('sheets', 'v4', credentials=creds)
+service = build('sheets', 'v4', credentials=creds, cache_discovery=False)
 sheet = service.spreadsheets()
 
 # === Configuración Email ===
@@ -27,6 +29,9 @@ RECIPIENTS = os.getenv("EMAIL_TO", "").split(",")
 # Zona horaria
 TZ_ARG = pytz.timezone("America/Argentina/Buenos_Aires")
 
+# TLS implícito (465) con verificación de certificado; un solo contexto por proceso
+SMTP_SSL_CONTEXT = ssl.create_default_context()
+
 # === Funciones ===
 def get_sheet_data():
     result = sheet.values().get(
@@ -91,7 +96,7 @@ def sentiment_badge(label: str) -> str:
         color = "#616161"
     return (
         f"<span style='display:inline-block;padding:2px 8px;border-radius:12px;"
-        f"font-size:12px;color:#fff;background:{color};'>{lab or 'NEUTRO'}</span>"
+        f"font-size:12px;color:#fff;background:{color};'>{html.escape(lab or 'NEUTRO', quote=False)}</span>"
     )
 
 
@@ -166,7 +171,7 @@ def format_email_html(df, window_label, competencia_df=None):
     
         dfpart["sent_order"] = dfpart["sentiment_norm"].map(sent_order).fillna(99)
 
-        return dfpart.sort_values("sent_order", ascending=True)
+        return dfpart.sort_values("sent_order", ascending=True, kind="stable")
 
     def render_card(row, show_sentiment=True):
         title = ""
@@ -178,7 +183,7 @@ def format_email_html(df, window_label, competencia_df=None):
                 title = cleaned
                 break
         if not title and len(row) > 3:
-            title = clean_value(row.iloc[3])
+            title = clean_value(list(row.values())[3])
     
         for col in ["snippet", "Snippet", "resumen", "body", "H"]:
             cand = row.get(col)
@@ -187,7 +192,7 @@ def format_email_html(df, window_label, competencia_df=None):
                 snippet = cleaned
                 break
         if not snippet and len(row) > 7:
-            snippet = clean_value(row.iloc[7])
+            snippet = clean_value(list(row.values())[7])
     
         source = clean_value(row.get("source") or row.get("domain") or row.get("G"))
         tier = clean_value(row.get("tier") or row.get("L"))
@@ -195,6 +200,12 @@ def format_email_html(df, window_label, competencia_df=None):
     
         # NUEVO: obtener TAG (columna I)
         tag = clean_value(row.get("tag_norm") or row.get("tag") or row.get("I"))
+
+        # texto del sheet escapado antes de interpolarlo (títulos con &, <, comillas en links)
+        title, snippet, source, tier, tag = (
+            html.escape(v, quote=False) for v in (title, snippet, source, tier, tag)
+        )
+        link = html.escape(link)
     
         tag_block = ""
         if tag:
@@ -241,10 +252,25 @@ def format_email_html(df, window_label, competencia_df=None):
 
     countries_order = ["Argentina", "Chile", "Peru"]
 
+    def split_by_country(frame):
+        # un solo groupby en lugar de comparar la columna completa una vez por país
+        if frame is None or frame.empty or "country" not in frame.columns:
+            return {}
+        return dict(tuple(frame.groupby("country", sort=False)))
+
+    inst_by_country = split_by_country(df)
+
+    # Competencia: orden + tope de 3 por país en una sola pasada vectorizada (cumcount)
+    comp_capped = None
+    if competencia_df is not None and not competencia_df.empty and "country" in competencia_df.columns:
+        comp_sorted = sort_news(competencia_df)
+        comp_capped = comp_sorted[comp_sorted.groupby("country", sort=False).cumcount() < 3]
+    comp_by_country = split_by_country(comp_capped)
+
     for country in countries_order:
         emoji = COUNTRY_EMOJIS.get(country, "")
 
-        inst_group = df[df.get("country") == country] if not df.empty else pd.DataFrame()
+        inst_group = inst_by_country.get(country, pd.DataFrame())
         if not inst_group.empty:
             body.append(
                 f"<div style='width:70%;margin:20px auto 10px auto;background-color:#000000;padding:10px 0;text-align:center;'>"
@@ -253,14 +279,11 @@ def format_email_html(df, window_label, competencia_df=None):
                 f"<span style='color:#fe2c55;'>Institutional — {country} {emoji}</span></span></div>"
             )
 
-            for _, row in sort_news(inst_group).iterrows():
+            # filas como dicts (sin armar una Series por fila como iterrows)
+            for row in sort_news(inst_group).to_dict("records"):
                 body.append(render_card(row, show_sentiment=True))
 
-        comp_group = (
-            competencia_df[competencia_df.get("country") == country]
-            if (competencia_df is not None and not competencia_df.empty)
-            else pd.DataFrame()
-        )
+        comp_group = comp_by_country.get(country, pd.DataFrame())
 
         if not comp_group.empty:
             body.append(
@@ -270,9 +293,7 @@ def format_email_html(df, window_label, competencia_df=None):
                 f"<span style='color:#fe2c55;'>Competencia — {country} {emoji}</span></span></div>"
             )
 
-            comp_sorted_limited = sort_news(comp_group).head(3)
-
-            for _, row in comp_sorted_limited.iterrows():
+            for row in comp_group.to_dict("records"):
                 body.append(render_card(row, show_sentiment=False))
 
     return "\n".join(body)
@@ -291,9 +312,9 @@ def send_email(subject, body):
     msg["From"] = EMAIL_USER
     msg["To"] = ", ".join(recipients)
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
+    with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=SMTP_SSL_CONTEXT) as server:
         server.login(EMAIL_USER, EMAIL_PASS)
-        server.sendmail(EMAIL_USER, recipients, msg.as_string())
+        server.send_message(msg, from_addr=EMAIL_USER, to_addrs=recipients)
 
 
 if __name__ == "__main__":
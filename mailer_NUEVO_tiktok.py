@@ -2,11 +2,13 @@ import os
 import json
 import pandas as pd
 import unicodedata
+import html
 from datetime import datetime, timedelta
 import pytz
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
 import smtplib
+import ssl
 from email.mime.text import MIMEText
 
 # === CONFIG ===
@@ -17,7 +19,7 @@ CONTAINER_WIDTH2 = "750px"
 
 creds_dict = json.loads(os.getenv("GOOGLE_CREDENTIALS"))
 creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-service = build('sheets', 'v4', credentials=creds)
+service = build('sheets', 'v4', credentials=creds, cache_discovery=False)
 sheet = service.spreadsheets()
 
 EMAIL_USER = os.getenv("EMAIL_USER_TIKTOK")
@@ -25,6 +27,9 @@ EMAIL_PASS = os.getenv("EMAIL_PASS_TIKTOK")
 
 TZ_ARG = pytz.timezone("America/Argentina/Buenos_Aires")
 
+# TLS implícito (465) con verificación de certificado; un solo contexto por proceso
+SMTP_SSL_CONTEXT = ssl.create_default_context()
+
 # === DATA ===
 def get_sheet_data():
     return get_data_from_range("2026!A:P")
@@ -63,13 +68,18 @@ def sentiment_badge(label):
     else:
         color = "#616161"
 
-    return f"<span style='background:{color};color:#fff;padding:2px 8px;border-radius:12px;font-size:12px;'>{lab}</span>"
+    return f"<span style='background:{color};color:#fff;padding:2px 8px;border-radius:12px;font-size:12px;'>{html.escape(lab, quote=False)}</span>"
 
 def clean_value(val):
     if val is None or pd.isna(val):
         return ""
     return str(val).strip()
 
+def clean_column(df, col):
+    if col not in df.columns:
+        return [""] * len(df)
+    return df[col].map(clean_value)
+
 # === CARD ===
 def render_card(row, tambien_en_html="", mostrar_sentiment=True):
     title = clean_value(row.get("title"))
@@ -80,6 +90,12 @@ def render_card(row, tambien_en_html="", mostrar_sentiment=True):
     tag = clean_value(row.get("tag")).upper()
     sentiment = clean_value(row.get("sentiment"))
 
+    # texto del sheet escapado antes de interpolarlo (títulos con &, <, comillas en links)
+    title, snippet, source, tier, tag = (
+        html.escape(v, quote=False) for v in (title, snippet, source, tier, tag)
+    )
+    link = html.escape(link)
+
     sentiment_html = ""
     if mostrar_sentiment:
         sentiment_html = f"<p><b>Sentiment:</b> {sentiment_badge(sentiment)}</p>"
@@ -222,24 +238,30 @@ def format_email_html(df, window_label, competencia_df=None):
                     if not secundarias.empty:
                         tiers = {}
 
-                        for _, row_sec in secundarias.iterrows():
-                            tier = clean_value(row_sec.get("tier"))
-                            source = clean_value(row_sec.get("source"))
-                            link = clean_value(row_sec.get("link"))
+                        # columnas completas una vez, sin iterrows
+                        for tier, source, link in zip(
+                            clean_column(secundarias, "tier"),
+                            clean_column(secundarias, "source"),
+                            clean_column(secundarias, "link"),
+                        ):
                             tiers.setdefault(tier, []).append((source, link))
 
-                        tambien_en_html = "<div style='margin-top:10px;font-size:13px;color:#000;'>"
-                        tambien_en_html += "<strong>También en:</strong><br>"
+                        tambien_parts = [
+                            "<div style='margin-top:10px;font-size:13px;color:#000;'>",
+                            "<strong>También en:</strong><br>",
+                        ]
 
                         for tier, items in sorted(tiers.items()):
-                            tambien_en_html += f"<strong>{tier}:</strong> "
-                            tambien_en_html += " | ".join(
-                                f"<a href='{l}' target='_blank'>{s}</a>" if l else s
+                            tambien_parts.append(f"<strong>{html.escape(tier, quote=False)}:</strong> ")
+                            tambien_parts.append(" | ".join(
+                                f"<a href='{html.escape(l)}' target='_blank'>{html.escape(s, quote=False)}</a>"
+                                if l else html.escape(s, quote=False)
                                 for s, l in items[:3]
-                            )
-                            tambien_en_html += "<br>"
+                            ))
+                            tambien_parts.append("<br>")
 
-                        tambien_en_html += "</div>"
+                        tambien_parts.append("</div>")
+                        tambien_en_html = "".join(tambien_parts)
 
                     body.append(render_card(principal, tambien_en_html, mostrar_sentiment=not is_competencia))
 
@@ -257,7 +279,7 @@ def format_email_html(df, window_label, competencia_df=None):
 
                 sin_tema = sin_tema.sort_values(by="tier_order", ascending=True)
 
-                for _, row in sin_tema.iterrows():
+                for row in sin_tema.to_dict("records"):
                     body.append(render_card(row, mostrar_sentiment=not is_competencia))
 
     render_block(df, is_competencia=False)
@@ -281,9 +303,9 @@ def send_email(subject, body):
     msg["From"] = EMAIL_USER
     msg["To"] = ", ".join(recipients)
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
+    with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=SMTP_SSL_CONTEXT) as server:
         server.login(EMAIL_USER, EMAIL_PASS)
-        server.sendmail(EMAIL_USER, recipients, msg.as_string())
+        server.send_message(msg, from_addr=EMAIL_USER, to_addrs=recipients)
 
 # === MAIN ===
 if __name__ == "__main__":
@@ -1,21 +1,49 @@
-# mailer.py
+# mailer_noticias.py
+# Mailer de noticias por perfil (Elsztain / IRSA): mismo flujo, distinta hoja,
+# destinatarios y asunto. Uso: python mailer_noticias.py <perfil>
+# (o MAILER_PROFILE=<perfil>).
 import os
+import sys
 import json
+import bisect
+import html
 import pandas as pd
 from datetime import datetime, timedelta
 import pytz
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
 import smtplib
+import ssl
 from email.mime.text import MIMEText
 from email.utils import formataddr
 
 # === Configuración Google Sheets ===
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
-# 👉 Ajustá estos dos si hace falta
-SPREADSHEET_ID = "1DTMBII9byTfx9KU6M1QghhlU8abCRh8rKThcnaTbzpE"
-SHEET_TAB = "NOTICIAS"   # el scraper escribe aquí
+# 👉 Un perfil por newsletter: hoja/pestaña donde escribe su scraper,
+# variable de entorno con los destinatarios y nombre para el asunto
+PROFILES = {
+    "elsztain": {
+        "spreadsheet_id": "1DTMBII9byTfx9KU6M1QghhlU8abCRh8rKThcnaTbzpE",
+        "sheet_tab": "NOTICIAS",
+        "recipients_env": "EMAIL_TO_ELSZTAIN",
+        "subject_name": "Elsztain",
+    },
+    "irsa": {
+        "spreadsheet_id": "1Lfj7gkdTwI-NdrXhnbgUNF9Fp2UpdcZ5n_mOZqZowRs",
+        "sheet_tab": "Hoja 1",
+        "recipients_env": "EMAIL_TO_IRSA",
+        "subject_name": "IRSA",
+    },
+}
+
+PROFILE_NAME = (sys.argv[1] if len(sys.argv) > 1 else os.getenv("MAILER_PROFILE", "")).strip().lower()
+if PROFILE_NAME not in PROFILES:
+    raise SystemExit(f"Perfil de mailer inválido: '{PROFILE_NAME}'. Opciones: {', '.join(PROFILES)}")
+PROFILE = PROFILES[PROFILE_NAME]
+
+SPREADSHEET_ID = PROFILE["spreadsheet_id"]
+SHEET_TAB = PROFILE["sheet_tab"]   # el scraper escribe aquí
 
 # Columnas esperadas por el scraper:
 SCRAPER_HEADER = ["date_utc", "title", "link", "source", "snippet", "sentiment", "scraped_at"]
@@ -28,11 +56,22 @@ sheet = service.spreadsheets()
 # === Configuración Email (Gmail SMTP) ===
 EMAIL_USER = os.getenv("EMAIL_USER_INSIGHTS")
 EMAIL_PASS = os.getenv("EMAIL_PASSWORD_INSIGHTS")
-RECIPIENTS = [e.strip() for e in os.getenv("EMAIL_TO_ELSZTAIN", "").split(",") if e.strip()]
+RECIPIENTS = [e.strip() for e in os.getenv(PROFILE["recipients_env"], "").split(",") if e.strip()]
 
 # Zona horaria
 TZ_ARG = pytz.timezone("America/Argentina/Buenos_Aires")
 
+# TLS implícito (465) con verificación de certificado; un solo contexto por proceso
+SMTP_SSL_CONTEXT = ssl.create_default_context()
+
+# Franjas de envío: (hora desde, hora hasta, (días atrás, hora) de inicio, hora de fin, etiqueta)
+SEND_WINDOWS = [
+    (7, 9, (1, 18), 8, "18:00 (día previo) - 08:00"),
+    (12, 14, (0, 8), 13, "08:00 - 13:00"),
+    (17, 19, (0, 13), 18, "13:00 - 18:00"),
+]
+SEND_START_HOURS = [w[0] for w in SEND_WINDOWS]
+
 # ==== Helpers ====
 def coalesce_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Asegura las columnas del scraper y mapea alias comunes."""
@@ -78,21 +117,13 @@ def filter_by_window(df: pd.DataFrame, now: datetime) -> tuple[pd.DataFrame, str
     df = df.copy()
     df["scraped_at_dt"] = dt.dt.tz_localize(TZ_ARG, nonexistent='NaT', ambiguous='NaT')
 
-    # Ventanas
-    if 7 <= now.hour < 9:
-        start = (now - timedelta(days=1)).replace(hour=18, minute=0, second=0, microsecond=0)
-        end   =  now.replace(hour=8, minute=0, second=0, microsecond=0)
-        label = "18:00 (día previo) - 08:00"
-    elif 12 <= now.hour < 14:
-        start = now.replace(hour=8, minute=0, second=0, microsecond=0)
-        end   = now.replace(hour=13, minute=0, second=0, microsecond=0)
-        label = "08:00 - 13:00"
-    elif 17 <= now.hour < 19:
-        start = now.replace(hour=13, minute=0, second=0, microsecond=0)
-        end   = now.replace(hour=18, minute=0, second=0, microsecond=0)
-        label = "13:00 - 18:00"
-    else:
+    # Ventanas: bisect sobre la hora de inicio de cada franja de envío
+    idx = bisect.bisect_right(SEND_START_HOURS, now.hour) - 1
+    if idx < 0 or now.hour >= SEND_WINDOWS[idx][1]:
         return pd.DataFrame(columns=SCRAPER_HEADER), "Fuera de ventana"
+    _, _, (start_days, start_hour), end_hour, label = SEND_WINDOWS[idx]
+    start = (now - timedelta(days=start_days)).replace(hour=start_hour, minute=0, second=0, microsecond=0)
+    end   = now.replace(hour=end_hour, minute=0, second=0, microsecond=0)
 
     mask = (df["scraped_at_dt"] >= start) & (df["scraped_at_dt"] < end)
     out = df.loc[mask].copy()
@@ -112,12 +143,12 @@ def sentiment_badge(label: str) -> str:
         color = "#616161"  # gris
     return (
         f"<span style='display:inline-block;padding:2px 8px;border-radius:12px;"
-        f"font-size:12px;color:#fff;background:{color};'>{lab or 'NEUTRO'}</span>"
+        f"font-size:12px;color:#fff;background:{color};'>{html.escape(lab or 'NEUTRO', quote=False)}</span>"
     )
 
-def html_escape(s: str) -> str:
-    # simplificado, evita romper HTML
-    return (s or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+def html_escape(s: str, quote: bool = False) -> str:
+    # html.escape (stdlib); quote=True también escapa comillas, para atributos como href
+    return html.escape(s or "", quote=quote)
 
 def format_email_html(df: pd.DataFrame, window_label: str) -> str:
     if df.empty:
@@ -138,12 +169,14 @@ def format_email_html(df: pd.DataFrame, window_label: str) -> str:
             f"<h3 style='margin:0 0 10px 0;font-size:18px;'>{src}</h3>"
             f"</div>"
         )
-        for _, row in group.iterrows():
-            title = html_escape(row.get("title", ""))
-            snippet = html_escape(row.get("snippet", ""))
-            link = row.get("link", "")
-            date_utc = html_escape(row.get("date_utc", ""))  # ya viene dd/mm/YYYY si seguiste el cambio
-            badge = sentiment_badge(row.get("sentiment", ""))
+        # columnas del grupo una sola vez (coalesce_columns garantiza que existen)
+        for title, snippet, link, date_utc, sentiment in zip(
+            group["title"], group["snippet"], group["link"], group["date_utc"], group["sentiment"]
+        ):
+            title = html_escape(title)
+            snippet = html_escape(snippet)
+            date_utc = html_escape(date_utc)  # ya viene dd/mm/YYYY si seguiste el cambio
+            badge = sentiment_badge(sentiment)
 
             body.append(
                 "<div style='margin:0 0 22px 0;'>"
@@ -152,7 +185,7 @@ def format_email_html(df: pd.DataFrame, window_label: str) -> str:
                 f"{date_utc} · {badge}"
                 "</div>"
                 f"<div style='font-size:14px;color:#333;margin:0 0 6px 0;'>{snippet}</div>"
-                f"<a href='{link}' target='_blank' style='font-size:13px;color:#1565c0;'>{html_escape(link)}</a>"
+                f"<a href='{html_escape(link, quote=True)}' target='_blank' style='font-size:13px;color:#1565c0;'>{html_escape(link)}</a>"
                 "</div>"
             )
 
@@ -169,9 +202,9 @@ def send_email(subject: str, body_html: str):
     msg["From"] = formataddr(("Noticias", EMAIL_USER))
     msg["To"] = ", ".join(RECIPIENTS)
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
+    with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=SMTP_SSL_CONTEXT) as server:
         server.login(EMAIL_USER, EMAIL_PASS)
-        server.sendmail(EMAIL_USER, RECIPIENTS, msg.as_string())
+        server.send_message(msg, from_addr=EMAIL_USER, to_addrs=RECIPIENTS)
 
 # === Ejecución ===
 if __name__ == "__main__":
@@ -188,7 +221,7 @@ if __name__ == "__main__":
         raise SystemExit(0)
 
     body = format_email_html(filtered, window_label)
-    subject = f"Noticias Elsztain ({window_label})"
+    subject = f"Noticias {PROFILE['subject_name']} ({window_label})"
 
     send_email(subject, body)
     print("✅ Email enviado correctamente.")
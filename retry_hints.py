@@ -0,0 +1,38 @@
+# retry_hints.py
+# Helper compartido por los scrapers: cuánto esperar antes de reintentar según
+# lo que pidió el servidor (Retry-After / x-ratelimit-reset), siempre acotado.
+import email.utils
+import math
+import time
+
+# tope común para cualquier espera de backoff (segundos)
+RETRY_MAX_DELAY = 60.0
+
+
+def retry_after_seconds(exc, max_delay=RETRY_MAX_DELAY):
+    """Seconds the server asked us to wait (Retry-After / x-ratelimit-reset), clamped to
+    [0, max_delay], or None if there is no usable hint."""
+    resp = getattr(exc, "resp", None)  # googleapiclient HttpError (httplib2 headers)
+    headers = resp if hasattr(resp, "get") else getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    if value:
+        value = str(value).strip()
+        if value.isdigit():
+            wait = float(value)
+        else:
+            try:
+                wait = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+    else:
+        try:
+            reset = float(headers.get("x-ratelimit-reset"))
+        except (TypeError, ValueError):
+            return None
+        # epoch absoluto o segundos relativos, según el proveedor
+        wait = reset - time.time() if reset > 1e9 else reset
+    if not math.isfinite(wait):
+        return None
+    return min(max_delay, max(0.0, wait))
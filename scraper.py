@@ -1,4 +1,5 @@
 from datetime import datetime
+from zoneinfo import ZoneInfo
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
@@ -6,11 +7,11 @@ from googleapiclient.errors import HttpError
 import google.generativeai as genai
 from apify_client import ApifyClient
 from newspaper import Article
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 import pandas as pd
 import numpy as np
 import requests
-import pytz
 import json
 import logging
 import os
@@ -24,6 +25,8 @@ import tempfile
 import calendar
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from retry_hints import retry_after_seconds, RETRY_MAX_DELAY
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
@@ -69,11 +72,14 @@ except Exception:
     MAX_ITEMS = 500
 
 TIME_PERIOD = os.getenv("TIME_PERIOD", "last_day")
-TZ_ARGENTINA = pytz.timezone("America/Argentina/Buenos_Aires")
+# Solo los campos del actor que usa el pipeline (el resto no viaja por la red)
+DATASET_FIELDS = ["title", "link", "domain", "source", "tier", "snippet", "date_utc"]
+TZ_ARGENTINA = ZoneInfo("America/Argentina/Buenos_Aires")
+# scraped_at común a toda la corrida (se calcula una sola vez)
+RUN_SCRAPED_AT = datetime.now(TZ_ARGENTINA).isoformat()
 
 # Concurrency tunables (env)
 MAX_CONCURRENT_ACTORS = int(os.getenv("MAX_CONCURRENT_ACTORS", "4"))
-MAX_CONCURRENT_DATASET_FETCH = int(os.getenv("MAX_CONCURRENT_DATASET_FETCH", "6"))
 
 # LLM concurrency guard (code-default; can be overridden via env if needed)
 LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "2"))
@@ -83,7 +89,7 @@ LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "2"))
 try:
     sa_info = json.loads(GOOGLE_CREDENTIALS_ENV)
     creds = service_account.Credentials.from_service_account_info(sa_info, scopes=SCOPES)
-    sheet_service = build('sheets', 'v4', credentials=creds).spreadsheets()
+    sheet_service = build('sheets', 'v4', credentials=creds, cache_discovery=False).spreadsheets()
 except Exception as e:
     logging.exception("Failed loading Google credentials (sanitized). Exiting.")
     sys.exit(1)
@@ -99,6 +105,10 @@ llm_semaphore = threading.Semaphore(LLM_MAX_CONCURRENT)
 # --- HTTP session (movida acá arriba: la necesitamos para resolver links de Google News
 # ANTES de la deduplicación, no solo más adelante para el fetch de body/sentiment) ---
 MAX_FETCH_WORKERS = int(os.getenv("MAX_FETCH_WORKERS", "3"))
+# El fallback de Google News son dos requests livianas por link: admite más concurrencia
+MAX_RESOLVE_WORKERS = int(os.getenv("MAX_RESOLVE_WORKERS", "8"))
+# Tope de texto de la noticia que viaja al modelo (más allá no mejora la clasificación)
+MODEL_PROMPT_MAX_CHARS = int(os.getenv("MODEL_PROMPT_MAX_CHARS", "8000"))
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "15"))
 REQUEST_RETRIES = int(os.getenv("REQUEST_RETRIES", "2"))
 REQUEST_SLEEP_BETWEEN = float(os.getenv("REQUEST_SLEEP_BETWEEN", "0.2"))
@@ -130,7 +140,7 @@ def atomic_write_json(path, data):
 
 
 # --- Helpers: backoff retry (reusable) ---
-def retry(fn, max_attempts=5, base_delay=1.5, max_delay=60, jitter=0.4, *args, **kwargs):
+def retry(fn, max_attempts=5, base_delay=1.5, max_delay=RETRY_MAX_DELAY, jitter=0.4, *args, **kwargs):
     attempt = 0
     while True:
         try:
@@ -140,8 +150,12 @@ def retry(fn, max_attempts=5, base_delay=1.5, max_delay=60, jitter=0.4, *args, *
             if attempt >= max_attempts:
                 logging.exception("Max retries reached calling %s", getattr(fn, "__name__", str(fn)))
                 raise
-            backoff = min(max_delay, base_delay * (2 ** (attempt - 1)))
-            sleep_for = backoff + random.random() * jitter
+            hinted = retry_after_seconds(e)
+            if hinted is not None:
+                sleep_for = min(max_delay, hinted) + random.random() * jitter
+            else:
+                backoff = min(max_delay, base_delay * (2 ** (attempt - 1)))
+                sleep_for = backoff + random.random() * jitter
             logging.warning("Call to %s failed (attempt %d/%d): %s — retrying in %.1fs",
                             getattr(fn, "__name__", str(fn)), attempt, max_attempts, e, sleep_for)
             time.sleep(sleep_for)
@@ -154,24 +168,91 @@ def safe_convert_date_col(df, col='date_utc'):
     try:
         dt = pd.to_datetime(df[col], utc=True, errors='coerce')
         dt = dt.dt.tz_convert(TZ_ARGENTINA)
-        df[col] = dt.dt.strftime('%d/%m/%Y').fillna('')
+        # dd/mm/YYYY armado con componentes vectorizados (dt.strftime va fila por fila)
+        valid = dt.notna()
+        out = pd.Series('', index=df.index, dtype=object)
+        d = dt[valid]
+        out[valid] = (
+            d.dt.day.astype(str).str.zfill(2) + '/'
+            + d.dt.month.astype(str).str.zfill(2) + '/'
+            + d.dt.year.astype(str)
+        )
+        df[col] = out
     except Exception:
         df[col] = df[col].astype(str).fillna('')
     return df
 
 
+AMP_SUFFIX_RE = re.compile(r'(/amp/?|=amp|=amp-type|\?outputType|\?outputType=amp-type|\.amp|/)$')
+
+
 def normalize_link(url):
     if not url:
         return ''
     url = str(url).strip()
-    url = re.sub(
-        r'(/amp/?|=amp|=amp-type|\?outputType|\?outputType=amp-type|\.amp|/)$',
-        '',
-        url
-    )
+    url = AMP_SUFFIX_RE.sub('', url)
     return url
 
 
+TRACKING_PARAM_PREFIXES = ('utm_', 'fbclid', 'gclid', 'mc_')
+
+
+def canonical_link(url):
+    """Dedup key: normalize_link + no tracking params, lowercase host without www."""
+    url = normalize_link(url)
+    if not url:
+        return ''
+    try:
+        p = urlsplit(url)
+    except ValueError:
+        return url
+    query = urlencode([
+        (k, v) for k, v in parse_qsl(p.query)
+        if not k.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ])
+    netloc = p.netloc.lower().removeprefix('www.')
+    return urlunsplit((p.scheme.lower(), netloc, p.path.rstrip('/'), query, ''))
+
+# isinstance tuples hoisted so the per-cell sanitizer doesn't rebuild them
+_NP_INT_TYPES = (np.integer,)
+_NP_FLOAT_TYPES = (np.floating,)
+_BOOL_TYPES = (np.bool_, bool)
+_EMPTY_MARKERS = frozenset(('nan', 'nat', 'none'))
+
+
+def sanitize_cell_str(cell):
+    """Sanitize a single DataFrame cell and return the string sent to Sheets."""
+    if cell is None:
+        return ''
+    if isinstance(cell, str):
+        return '' if cell.lower() in _EMPTY_MARKERS else cell
+    if isinstance(cell, _NP_INT_TYPES):
+        return str(int(cell))
+    if isinstance(cell, _NP_FLOAT_TYPES):
+        fv = float(cell)
+        return '' if math.isnan(fv) or math.isinf(fv) else str(fv)
+    if isinstance(cell, _BOOL_TYPES):
+        return str(bool(cell))
+    if isinstance(cell, pd.Timestamp):
+        return '' if pd.isna(cell) else cell.isoformat()
+    val = str(cell)
+    return '' if val.lower() in _EMPTY_MARKERS else val
+
+
+def sanitize_frame_str(df):
+    """Column-wise sanitize_cell_str: text columns are cleaned with vectorized ops,
+    only non-text columns fall back to the per-cell rules."""
+    clean = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object or pd.api.types.is_string_dtype(s):
+            txt = s.astype(str).fillna('')
+            clean[col] = txt.mask(txt.str.lower().isin(list(_EMPTY_MARKERS)), '')
+        else:
+            clean[col] = s.map(sanitize_cell_str)
+    return pd.DataFrame(clean, index=df.index)
+
+
 def format_week_range(date_str):
     if not date_str or pd.isna(date_str):
         return ''
@@ -195,6 +276,15 @@ def is_unresolved_google_link(url):
     return 'news.google.com' in url or '/goto?url=' in url
 
 
+GNEWS_ARTICLE_ID_RE = re.compile(r'articles/([^?]+)')
+GNEWS_URL_PARAM_RE = re.compile(r'url=([^&]+)')
+GNEWS_SG_RE = re.compile(rb'data-n-a-sg="([^"]+)"')
+GNEWS_TS_RE = re.compile(rb'data-n-a-ts="([^"]+)"')
+GNEWS_STREAM_CHUNK = 16 * 1024
+GNEWS_SCAN_OVERLAP = 1024
+GNEWS_MAX_PAGE_BYTES = 2 * 1024 * 1024
+
+
 def resolve_google_news_link(url, http_session, timeout=10):
     """
     Resuelve un link /goto?url=... o /rss/articles/... de Google News a la URL real
@@ -204,24 +294,34 @@ def resolve_google_news_link(url, http_session, timeout=10):
     Si algo falla en el camino, devuelve la URL original tal cual vino (fail-safe).
     """
     try:
-        match = re.search(r'articles/([^?]+)', url) or re.search(r'url=([^&]+)', url)
+        match = GNEWS_ARTICLE_ID_RE.search(url) or GNEWS_URL_PARAM_RE.search(url)
         if not match:
             return url
         article_id = match.group(1)
 
         # 1) Obtener signature y timestamp de la página del artículo
         article_url = f'https://news.google.com/articles/{article_id}'
-        resp = http_session.get(article_url, timeout=timeout)
-        if resp.status_code != 200:
+        # Se lee en streaming y se corta apenas aparecen ambos atributos
+        signature = timestamp = None
+        with http_session.get(article_url, timeout=timeout, stream=True) as resp:
+            if resp.status_code != 200:
+                return url
+            buf = bytearray()
+            for chunk in resp.iter_content(chunk_size=GNEWS_STREAM_CHUNK):
+                # re-escanea un margen por si un atributo quedó partido entre chunks
+                scan_from = max(0, len(buf) - GNEWS_SCAN_OVERLAP)
+                buf.extend(chunk)
+                if signature is None:
+                    m = GNEWS_SG_RE.search(buf, scan_from)
+                    signature = m.group(1).decode('utf-8', 'ignore') if m else None
+                if timestamp is None:
+                    m = GNEWS_TS_RE.search(buf, scan_from)
+                    timestamp = m.group(1).decode('utf-8', 'ignore') if m else None
+                if (signature and timestamp) or len(buf) >= GNEWS_MAX_PAGE_BYTES:
+                    break
+        if not signature or not timestamp:
             return url
 
-        sg_match = re.search(r'data-n-a-sg="([^"]+)"', resp.text)
-        ts_match = re.search(r'data-n-a-ts="([^"]+)"', resp.text)
-        if not sg_match or not ts_match:
-            return url
-
-        signature, timestamp = sg_match.group(1), ts_match.group(1)
-
         # 2) Llamar al endpoint batchexecute con esos parámetros
         inner = json.dumps([
             "garturlreq",
@@ -292,56 +392,66 @@ def run_actor_task(task):
         return {"query": query, "country": country, "run": None, "dataset_id": None, "error": str(e)}
 
 
-actor_results = []
-with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ACTORS) as ex:
-    futures = {ex.submit(run_actor_task, t): t for t in tasks}
-    for fut in as_completed(futures):
-        res = fut.result()
-        if res["error"]:
-            logging.warning("Run failed for %s - %s: %s", res["country"], res["query"], res["error"])
-            continue
-        if not res["dataset_id"]:
-            logging.warning("No dataset generated for %s - %s", res["country"], res["query"])
-            continue
-        actor_results.append(res)
-
-logging.info("Actor executions completed: %d successful / %d total", len(actor_results), len(tasks))
-
-
-# --- Descarga datasets en paralelo ---
+# --- Descarga del dataset de cada run ---
 def fetch_dataset_items(entry):
     dataset_id = entry["dataset_id"]
     country = entry["country"]
     query = entry["query"]
     try:
-        items = retry(lambda: apify_client.dataset(dataset_id).list_items().items, max_attempts=4)
+        items = retry(
+            lambda: list(apify_client.dataset(dataset_id).iterate_items(fields=DATASET_FIELDS, clean=True)),
+            max_attempts=4
+        )
         if not items:
             logging.info("No items for dataset %s (%s - %s)", dataset_id, country, query)
             return None
-        df = pd.DataFrame(items)
-        df["country"] = country
-        df["query"] = query
-        df["scraped_at"] = datetime.now(TZ_ARGENTINA).isoformat()
-        return df
+        # Los items se etiquetan en el lugar; el DataFrame se arma una sola vez al final
+        for item in items:
+            item["country"] = country
+            item["query"] = query
+            item["scraped_at"] = RUN_SCRAPED_AT
+        return items
     except Exception as e:
         logging.exception("Error listing items for dataset %s.", dataset_id)
         return None
 
 
-all_dfs = []
-with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DATASET_FETCH) as ex:
-    futures = {ex.submit(fetch_dataset_items, r): r for r in actor_results}
+def run_and_fetch(task):
+    """Corre el actor y baja su dataset en la misma tarea: no hay barrera entre ambas fases."""
+    res = run_actor_task(task)
+    if res["error"]:
+        logging.warning("Run failed for %s - %s: %s", res["country"], res["query"], res["error"])
+        return None
+    if not res["dataset_id"]:
+        logging.warning("No dataset generated for %s - %s", res["country"], res["query"])
+        return None
+    return fetch_dataset_items(res)
+
+
+all_items = []
+tasks_with_items = 0
+with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ACTORS) as ex:
+    futures = {ex.submit(run_and_fetch, t): t for t in tasks}
     for fut in as_completed(futures):
-        df = fut.result()
-        if df is not None and not df.empty:
-            all_dfs.append(df)
+        items = fut.result()
+        if items:
+            tasks_with_items += 1
+            all_items.extend(items)
+
+logging.info("Actor runs + dataset downloads completed: %d with items / %d total", tasks_with_items, len(tasks))
 
-if not all_dfs:
+if not all_items:
     logging.error("No results obtained from any country. Exiting without updating sheet.")
     sys.exit(0)
 
 # --- Build final dataframe and normalize columns ---
-final_df = pd.concat(all_dfs, ignore_index=True)
+final_df = pd.DataFrame.from_records(all_items)
+del all_items
+
+# country/query repiten unos pocos valores: category los guarda como códigos enteros
+for col in ('country', 'query'):
+    if col in final_df.columns:
+        final_df[col] = final_df[col].astype('category')
 
 if 'link' in final_df.columns:
     final_df['link'] = final_df['link'].apply(normalize_link)
@@ -361,7 +471,7 @@ if 'link' in final_df.columns:
         def _resolve_row(link):
             return resolve_google_news_link(link, session) if is_unresolved_google_link(link) else link
 
-        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as ex:
+        with ThreadPoolExecutor(max_workers=MAX_RESOLVE_WORKERS) as ex:
             resolved_links = list(ex.map(_resolve_row, final_df.loc[unresolved_mask, 'link'].tolist()))
         final_df.loc[unresolved_mask, 'link'] = resolved_links
 
@@ -369,7 +479,9 @@ if 'link' in final_df.columns:
         logging.info("Fallback completado. Links sin resolver restantes: %d", still_unresolved)
 
     final_df['link'] = final_df['link'].apply(normalize_link)
-    final_df.drop_duplicates(subset=["link"], inplace=True)
+    # Dedup sobre la forma canónica (sin utm_/fbclid, www, mayúsculas en host)
+    final_df['link_canon'] = final_df['link'].map(canonical_link)
+    final_df.drop_duplicates(subset=["link_canon"], inplace=True)
 else:
     logging.warning("No 'link' column present in scraped items; duplicates won't be removed by link.")
 
@@ -403,7 +515,7 @@ for col in ('tag', 'semana', 'sentiment'):
     if col not in final_df.columns:
         final_df[col] = ''
 
-final_df['country'] = final_df['country'].replace({'ar': 'Argentina', 'cl': 'Chile', 'pe': 'Peru'})
+final_df['country'] = final_df['country'].cat.rename_categories({'ar': 'Argentina', 'cl': 'Chile', 'pe': 'Peru'})
 
 try:
     final_df['scraped_at'] = pd.to_datetime(final_df['scraped_at'], errors='coerce').dt.strftime('%d/%m/%Y %H:%M').fillna('')
@@ -412,7 +524,7 @@ except Exception:
 
 # --- Article fetch + parse w/ Session + ThreadPool (cache simple) ---
 CACHE_PATH = os.getenv("ARTICLE_CACHE_PATH", "article_cache.json")
-TIKTOK_PATTERN = re.compile(r"tik\s*-?\s*tok(er)?|redes?\s+sociales?", flags=re.IGNORECASE)
+TIKTOK_PATTERN = re.compile(r"tik\s*-?\s*tok(?:er)?|redes?\s+sociales?", flags=re.IGNORECASE)
 
 
 def load_cache(path):
@@ -436,7 +548,7 @@ article_cache = load_cache(CACHE_PATH)
 
 
 def url_key(u):
-    return normalize_link(u)
+    return canonical_link(u)
 
 
 def fetch_html_with_retries(url):
@@ -452,6 +564,21 @@ def fetch_html_with_retries(url):
     return None
 
 
+def extract_paragraphs_text(html):
+    """Texto de todos los <p> del documento, parseado con lxml (mucho más rápido que html.parser)."""
+    if not html:
+        return ""
+    try:
+        if isinstance(html, str):
+            tree = lxml.html.fromstring(html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8"))
+        else:
+            tree = lxml.html.fromstring(html)
+    except (etree.ParserError, ValueError):
+        return ""
+    parts = (" ".join(p.text_content().split()) for p in tree.iter("p"))
+    return " ".join(t for t in parts if t)
+
+
 def extract_body_from_html(url, html):
     try:
         art = Article(url, language='es')
@@ -481,10 +608,14 @@ def fetch_and_parse(url):
 # ---------------------------
 # Filtro robusto (keep only rows mentioning TikTok)
 # ---------------------------
-mask = (
-    final_df.get('title', '').astype(str).str.contains(TIKTOK_PATTERN, na=False) |
-    final_df.get('snippet', '').astype(str).str.contains(TIKTOK_PATTERN, na=False)
-)
+# Primero el título; el snippet solo se escanea en las filas que el título no resolvió
+if 'title' in final_df.columns:
+    mask = final_df['title'].fillna('').astype(str).str.contains(TIKTOK_PATTERN)
+else:
+    mask = pd.Series(False, index=final_df.index)
+pending = ~mask
+if 'snippet' in final_df.columns and pending.any():
+    mask.loc[pending] = final_df.loc[pending, 'snippet'].fillna('').astype(str).str.contains(TIKTOK_PATTERN)
 before_tot = len(final_df)
 final_df = final_df[mask].copy()
 after_tot = len(final_df)
@@ -529,15 +660,19 @@ NORMALIZATION_MAP = {
 }
 
 
+MODEL_PUNCT_RE = re.compile(r"[\"'\.\,]")
+MODEL_TOKEN_SPLIT_RE = re.compile(r"[\s,;:()\[\]\"']+")
+
+
 def normalize_category_from_model_output(raw_text):
     if not raw_text:
         return "Corporate Reputation"
     r = raw_text.strip().upper()
-    r_clean = re.sub(r"[\"'\.\,]", " ", r)
+    r_clean = MODEL_PUNCT_RE.sub(" ", r)
     for key, canonical in NORMALIZATION_MAP.items():
         if key in r_clean:
             return canonical
-    for token in re.split(r"[\s,;:()\[\]\"']+", r_clean):
+    for token in MODEL_TOKEN_SPLIT_RE.split(r_clean):
         token = token.strip()
         if not token:
             continue
@@ -550,23 +685,18 @@ def normalize_category_from_model_output(raw_text):
     return "Corporate Reputation"
 
 
-def build_prompt_from_text(texto):
-    max_chars = 12000
-    t = (texto or "").strip()
-    if len(t) > max_chars:
-        t = t[:max_chars]
-    allowed = [
-        "Consumer & Brand",
-        "Music",
-        "B2B",
-        "SMB",
-        "Creator",
-        "Product",
-        "TnS",
-        "Corporate Reputation",
-    ]
-    allowed_line = ", ".join(allowed)
-    prompt = f"""
+CATEGORY_ALLOWED_LINE = ", ".join([
+    "Consumer & Brand",
+    "Music",
+    "B2B",
+    "SMB",
+    "Creator",
+    "Product",
+    "TnS",
+    "Corporate Reputation",
+])
+# Parte fija del prompt de categoría: se arma una sola vez al cargar el módulo
+CATEGORY_PROMPT_PREFIX = f"""
 ROL
 Actúa como un Analista de Datos Senior especializado en PR y Reputación Corporativa de TikTok.
 Tu única misión es clasificar la noticia en UNA sola categoría estratégica.
@@ -590,15 +720,18 @@ Si la noticia impacta la imagen institucional, legal o regulatoria de la empresa
 INSTRUCCIONES CRÍTICAS (LEER ATENTAMENTE)
 1) ANALIZA la noticia provista abajo.
 2) RESPONDE EXACTAMENTE con UNA de las siguientes cadenas (sin comillas, sin punto final, sin texto extra, sin explicación):
-    {allowed_line}
+    {CATEGORY_ALLOWED_LINE}
 3) RESPONDE SOLO con la cadena EXACTA: por ejemplo: Product  (sin comillas)
 4) Si por alguna razón NO PUEDES CLASIFICAR (texto ausente o incompleto), RESPONDE EXACTAMENTE: Corporate Reputation
 5) NO agregues ninguna otra palabra, puntuación ni carácter.
 
 NOTICIA:
-{t}
 """
-    return prompt
+
+
+def build_prompt_from_text(texto):
+    t = (texto or "").strip()[:MODEL_PROMPT_MAX_CHARS]
+    return CATEGORY_PROMPT_PREFIX + t + "\n"
 
 
 # --- Limpieza variable obsoleta si estaba presente ---
@@ -710,16 +843,7 @@ final_df["tag"] = ""
 # SENTIMENT CLASSIFICATION (POSITIVO / NEGATIVO / NEUTRO) - using Gemini
 # ---------------------------
 
-def analizar_noticia(url):
-    try:
-        response = session.get(url, timeout=REQUEST_TIMEOUT)
-        if response.status_code != 200 or not response.text:
-            return "NEUTRO"
-        soup = BeautifulSoup(response.text, "html.parser")
-        paragraphs = [p.get_text() for p in soup.find_all("p")]
-        texto = " ".join(paragraphs)
-
-        prompt = f"""
+SENTIMENT_PROMPT_PREFIX = """
         ROL
 Actúa como Analista Senior de PR/Reputación. Tu única tarea es determinar si la noticia
 es POSITIVA, NEGATIVA o NEUTRA respecto a la reputación de TikTok como empresa/plataforma.
@@ -732,9 +856,18 @@ INSTRUCCIONES (leer atentamente)
 - Respuestas aceptadas: ['POSITIVO','NEGATIVO','NEUTRO']
 
 NOTICIA:
-        {texto}
         """
 
+
+def analizar_noticia(url):
+    try:
+        response = session.get(url, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200 or not response.text:
+            return "NEUTRO"
+        texto = extract_paragraphs_text(response.text)
+
+        prompt = SENTIMENT_PROMPT_PREFIX + texto[:MODEL_PROMPT_MAX_CHARS] + "\n        "
+
         with llm_semaphore:
             resp = model.generate_content(prompt)
         resultado = getattr(resp, "text", "") or ""
@@ -752,32 +885,50 @@ NOTICIA:
 
 # Ensure column order and presence (header keeps 'tag' and 'sentiment' if you want both)
 header = ['semana', 'date_utc', 'country', 'title', 'link', 'domain', 'source', 'tier', 'snippet', 'tag', 'sentiment', 'scraped_at']
-final_df = final_df.reindex(columns=header, fill_value='')
-final_df['link'] = final_df['link'].astype(str).apply(normalize_link)
-final_df = final_df.drop_duplicates(subset='link')
+final_df = final_df.reindex(columns=header + ['link_canon'], fill_value='')
+final_df = final_df.drop_duplicates(subset='link_canon')
 final_df = final_df.drop_duplicates(subset=["title", "snippet"])
 
 # --- Read existing sheet and combine (incremental append instead of full rewrite) ---
 SHEET_RANGE = "2026!A:L"
 HEADER = ['semana', 'date_utc', 'country', 'title', 'link', 'domain', 'source', 'tier', 'snippet', 'tag', 'sentiment', 'scraped_at']
 
-# 1) Read current sheet values (if any)
+SHEET_TAB = SHEET_RANGE.split("!")[0]
+
+
+def sheet_col_letter(idx):
+    return chr(ord('A') + idx)
+
+
+def batch_get_values(ranges):
+    result = sheet_service.values().batchGet(spreadsheetId=SPREADSHEET_ID, ranges=ranges).execute()
+    value_ranges = [vr.get("values", []) for vr in result.get("valueRanges", [])]
+    return value_ranges + [[] for _ in range(len(ranges) - len(value_ranges))]
+
+
+# 1) Read header row + link column in one round-trip (the other columns aren't needed for dedup)
+expected_link_idx = HEADER.index('link')
+link_col = sheet_col_letter(expected_link_idx)
+sheet_read_failed = False
 try:
-    result = sheet_service.values().get(spreadsheetId=SPREADSHEET_ID, range=SHEET_RANGE).execute()
-    values = result.get("values", [])
-    logging.info("Read %d rows from sheet (including header if present).", len(values))
+    header_values, link_values = batch_get_values(
+        [f"{SHEET_TAB}!1:1", f"{SHEET_TAB}!{link_col}2:{link_col}"]
+    )
+    logging.info("Read header + %d link cells from sheet.", len(link_values))
 except HttpError as e:
     logging.exception("Failed to read existing sheet (sanitized): %s", e)
-    values = []
+    header_values, link_values = [], []
+    sheet_read_failed = True
 except Exception as e:
     logging.exception("Failed to read existing sheet (sanitized): %s", e)
-    values = []
+    header_values, link_values = [], []
+    sheet_read_failed = True
 
 # 2) Build set of existing links from the sheet to avoid duplicate appends
-existing_links_set = set()
+existing_links_set = frozenset()
 sheet_has_header = False
-if values and len(values) >= 1:
-    header_row = values[0]
+header_row = header_values[0] if header_values else []
+if header_row:
     link_idx = None
     try:
         link_idx = header_row.index('link')
@@ -789,70 +940,43 @@ if values and len(values) >= 1:
             sheet_has_header = True
         else:
             if len(header_row) == len(HEADER):
-                try:
-                    link_idx = HEADER.index('link')
-                    sheet_has_header = True
-                except Exception:
-                    link_idx = None
+                link_idx = expected_link_idx
+                sheet_has_header = True
+
+    if link_idx is not None and link_idx != expected_link_idx:
+        # sheet columns are in a different order: re-read the right column
+        col = sheet_col_letter(link_idx)
+        try:
+            link_values = batch_get_values([f"{SHEET_TAB}!{col}2:{col}"])[0]
+        except Exception as e:
+            logging.exception("Failed to read link column (sanitized): %s", e)
+            link_idx = None
 
     if link_idx is not None:
-        for r in values[1:]:
-            try:
-                if len(r) > link_idx:
-                    v = normalize_link(r[link_idx].strip())
-                    if v:
-                        existing_links_set.add(v)
-            except Exception:
-                continue
+        existing_links_set = frozenset(
+            v for v in (canonical_link(r[0]) for r in link_values if r) if v
+        )
 
-sheet_empty = len(values) == 0
+# a failed read says nothing about the sheet: don't treat it as empty (no header write)
+sheet_empty = not sheet_read_failed and not header_row and not link_values
 
 # 3) Ensure final_df has correct columns and sanitized values
 for col in HEADER:
     if col not in final_df.columns:
         final_df[col] = ''
 
+# categorical columns back to plain objects so blanks can be filled in
+final_df = final_df.astype({c: object for c in final_df.select_dtypes('category').columns})
 final_df = final_df.replace([np.nan, pd.NaT, None], '').replace([np.inf, -np.inf], '')
 
-# Build list of candidate rows (in correct order), and filter out ones with link already in sheet
-rows_to_add = []
-new_links_count = 0
-for row in final_df[HEADER].values.tolist():
-    row_map = dict(zip(HEADER, row))
-    link = normalize_link(str(row_map.get('link', '')).strip())
-    if not link:
-        continue
-    if link in existing_links_set:
-        continue
-    sanitized_cells = []
-    for cell in row:
-        if isinstance(cell, (np.integer,)):
-            val = int(cell)
-        elif isinstance(cell, (np.floating,)):
-            fv = float(cell)
-            if math.isnan(fv) or math.isinf(fv):
-                val = ''
-            else:
-                val = fv
-        elif isinstance(cell, (np.bool_, bool)):
-            val = bool(cell)
-        else:
-            try:
-                if isinstance(cell, pd.Timestamp):
-                    if pd.isna(cell):
-                        val = ''
-                    else:
-                        val = cell.isoformat()
-                else:
-                    val = '' if cell is None else str(cell)
-            except Exception:
-                val = '' if cell is None else str(cell)
-        if isinstance(val, str) and val.lower() in ('nan', 'nat', 'none'):
-            val = ''
-        sanitized_cells.append(val)
-    rows_to_add.append([str(c) for c in sanitized_cells])
-    existing_links_set.add(link)
-    new_links_count += 1
+# Vectorized filter: drop empty links, links already in the sheet and repeats within this run
+link_norm = final_df['link_canon'].astype(str)
+new_mask = link_norm.ne('') & ~link_norm.isin(existing_links_set) & ~link_norm.duplicated()
+logging.info("Rows not yet in sheet: %d of %d", int(new_mask.sum()), len(final_df))
+
+# Build list of candidate rows (in correct order)
+rows_to_add = sanitize_frame_str(final_df.loc[new_mask, HEADER]).to_numpy(dtype=object).tolist()
+new_links_count = len(rows_to_add)
 
 if new_links_count == 0 and not sheet_empty:
     logging.info("No new rows to add. Exiting without touching the sheet.")
@@ -884,7 +1008,9 @@ def append_with_retry(batch, max_attempts=5, base_delay=1.5):
             if attempt >= max_attempts:
                 logging.exception("Failed to append batch to Sheets after %d attempts (sanitized).", attempt)
                 raise
-            sleep_for = min(60, base_delay * (2 ** (attempt - 1))) + random.random() * 0.5
+            hinted = retry_after_seconds(e)
+            backoff = hinted if hinted is not None else base_delay * (2 ** (attempt - 1))
+            sleep_for = min(RETRY_MAX_DELAY, backoff) + random.random() * 0.5
             logging.warning("HttpError appending to Sheets (attempt %d/%d) — retrying in %.1fs", attempt, max_attempts, sleep_for)
             time.sleep(sleep_for)
         except Exception as e:
@@ -892,17 +1018,20 @@ def append_with_retry(batch, max_attempts=5, base_delay=1.5):
             if attempt >= max_attempts:
                 logging.exception("Failed to append batch to Sheets after %d attempts (sanitized).", attempt)
                 raise
-            sleep_for = min(60, base_delay * (2 ** (attempt - 1))) + random.random() * 0.5
+            hinted = retry_after_seconds(e)
+            backoff = hinted if hinted is not None else base_delay * (2 ** (attempt - 1))
+            sleep_for = min(RETRY_MAX_DELAY, backoff) + random.random() * 0.5
             logging.warning("Error appending to Sheets (attempt %d/%d) — retrying in %.1fs", attempt, max_attempts, sleep_for)
             time.sleep(sleep_for)
 
 
-# if sheet empty, write header first (one-time)
-if sheet_empty:
-    logging.info("Sheet empty: writing header first.")
+# if sheet empty, the header travels with the first batch (one write instead of two)
+pending_header = [HEADER] if sheet_empty else []
+if pending_header and not rows_to_add:
+    logging.info("Sheet empty and nothing to append: writing header only.")
     try:
-        append_with_retry([HEADER])
-    except Exception as e:
+        append_with_retry(pending_header)
+    except Exception:
         logging.exception("Could not write header to sheet (sanitized).")
         raise
 
@@ -911,7 +1040,8 @@ total_added = 0
 for i in range(0, len(rows_to_add), BATCH_SIZE):
     batch = rows_to_add[i:i + BATCH_SIZE]
     try:
-        append_with_retry(batch)
+        append_with_retry(pending_header + batch)
+        pending_header = []
         total_added += len(batch)
         logging.info("Appended batch %d..%d (rows=%d) to sheet.", i, i + len(batch) - 1, len(batch))
     except Exception as e:
@@ -1,4 +1,5 @@
 from datetime import datetime
+from zoneinfo import ZoneInfo
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
@@ -6,11 +7,11 @@ from googleapiclient.errors import HttpError
 import google.generativeai as genai
 from apify_client import ApifyClient
 from newspaper import Article
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 import pandas as pd
 import numpy as np
 import requests
-import pytz
 import json
 import logging
 import os
@@ -23,7 +24,9 @@ import threading
 import tempfile
 import calendar
 import unicodedata
+import sqlite3
 from requests.adapters import HTTPAdapter
+from retry_hints import retry_after_seconds, RETRY_MAX_DELAY
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
@@ -83,18 +86,23 @@ except Exception:
     MAX_ITEMS = 500
 
 TIME_PERIOD = os.getenv("TIME_PERIOD", "last_day")
-TZ_ARGENTINA = pytz.timezone("America/Argentina/Buenos_Aires")
+# Solo los campos del actor que usa el pipeline (el resto no viaja por la red)
+DATASET_FIELDS = ["title", "link", "domain", "source", "snippet", "date_utc"]
+TZ_ARGENTINA = ZoneInfo("America/Argentina/Buenos_Aires")
+# scraped_at común a toda la corrida (se calcula una sola vez)
+RUN_SCRAPED_AT = datetime.now(TZ_ARGENTINA).isoformat()
 
 # Concurrency tunables
 MAX_CONCURRENT_ACTORS = int(os.getenv("MAX_CONCURRENT_ACTORS", "4"))
-MAX_CONCURRENT_DATASET_FETCH = int(os.getenv("MAX_CONCURRENT_DATASET_FETCH", "6"))
 LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "2"))
+# Tope de texto de la noticia que viaja al modelo (más allá no mejora la clasificación)
+MODEL_PROMPT_MAX_CHARS = int(os.getenv("MODEL_PROMPT_MAX_CHARS", "8000"))
 
 # --- Google Sheets client ---
 try:
     sa_info = json.loads(GOOGLE_CREDENTIALS_ENV)
     creds = service_account.Credentials.from_service_account_info(sa_info, scopes=SCOPES)
-    sheet_service = build("sheets", "v4", credentials=creds).spreadsheets()
+    sheet_service = build("sheets", "v4", credentials=creds, cache_discovery=False).spreadsheets()
 except Exception:
     logging.exception("Failed loading Google credentials (sanitized). Exiting.")
     sys.exit(1)
@@ -122,7 +130,7 @@ def atomic_write_json(path, data):
         logging.warning("atomic_write_json failed for %s: %s", path, e)
 
 # --- Helpers: backoff retry ---
-def retry(fn, max_attempts=5, base_delay=1.5, max_delay=60, jitter=0.4, *args, **kwargs):
+def retry(fn, max_attempts=5, base_delay=1.5, max_delay=RETRY_MAX_DELAY, jitter=0.4, *args, **kwargs):
     attempt = 0
     while True:
         try:
@@ -132,8 +140,12 @@ def retry(fn, max_attempts=5, base_delay=1.5, max_delay=60, jitter=0.4, *args, *
             if attempt >= max_attempts:
                 logging.exception("Max retries reached calling %s", getattr(fn, "__name__", str(fn)))
                 raise
-            backoff = min(max_delay, base_delay * (2 ** (attempt - 1)))
-            sleep_for = backoff + random.random() * jitter
+            hinted = retry_after_seconds(e)
+            if hinted is not None:
+                sleep_for = min(max_delay, hinted) + random.random() * jitter
+            else:
+                backoff = min(max_delay, base_delay * (2 ** (attempt - 1)))
+                sleep_for = backoff + random.random() * jitter
             logging.warning(
                 "Call to %s failed (attempt %d/%d): %s — retrying in %.1fs",
                 getattr(fn, "__name__", str(fn)), attempt, max_attempts, e, sleep_for
@@ -147,7 +159,16 @@ def safe_convert_date_col(df, col="date_utc"):
     try:
         dt = pd.to_datetime(df[col], utc=True, errors="coerce")
         dt = dt.dt.tz_convert(TZ_ARGENTINA)
-        df[col] = dt.dt.strftime("%d/%m/%Y").fillna("")
+        # dd/mm/YYYY armado con componentes vectorizados (dt.strftime va fila por fila)
+        valid = dt.notna()
+        out = pd.Series("", index=df.index, dtype=object)
+        d = dt[valid]
+        out[valid] = (
+            d.dt.day.astype(str).str.zfill(2) + "/"
+            + d.dt.month.astype(str).str.zfill(2) + "/"
+            + d.dt.year.astype(str)
+        )
+        df[col] = out
     except Exception:
         df[col] = df[col].astype(str).fillna("")
     return df
@@ -164,20 +185,71 @@ def format_week_range(date_str):
     except Exception:
         return ""
 
+WHITESPACE_RE = re.compile(r"\s+")
+
 def normalize_for_match(text):
     if text is None:
         return ""
     text = str(text)
     text = unicodedata.normalize("NFKD", text)
     text = "".join(ch for ch in text if not unicodedata.combining(ch))
-    text = re.sub(r"\s+", " ", text)
+    text = WHITESPACE_RE.sub(" ", text)
     return text.upper().strip()
 
+def minimize_any_match_terms(terms):
+    """
+    Dedup de términos ya normalizados para chequeos tipo any(term in text).
+    Si un término contiene a otro más corto, el corto ya lo cubre: se descarta.
+    Quedan ordenados de más corto a más largo (los más genéricos se prueban primero).
+    """
+    kept = []
+    for term in sorted({t for t in terms if t}, key=len):
+        if not any(k in term for k in kept):
+            kept.append(term)
+    return kept
+
 def safe_series(df, col):
     if col in df.columns:
         return df[col].fillna("").astype(str)
     return pd.Series([""] * len(df), index=df.index, dtype="object")
 
+# isinstance tuples hoisted so the per-cell sanitizer doesn't rebuild them
+_NP_INT_TYPES = (np.integer,)
+_NP_FLOAT_TYPES = (np.floating,)
+_BOOL_TYPES = (np.bool_, bool)
+_EMPTY_MARKERS = frozenset(("nan", "nat", "none"))
+
+def sanitize_cell_str(cell):
+    """Sanitize a single DataFrame cell and return the string sent to Sheets."""
+    if cell is None:
+        return ""
+    if isinstance(cell, str):
+        return "" if cell.lower() in _EMPTY_MARKERS else cell
+    if isinstance(cell, _NP_INT_TYPES):
+        return str(int(cell))
+    if isinstance(cell, _NP_FLOAT_TYPES):
+        fv = float(cell)
+        return "" if math.isnan(fv) or math.isinf(fv) else str(fv)
+    if isinstance(cell, _BOOL_TYPES):
+        return str(bool(cell))
+    if isinstance(cell, pd.Timestamp):
+        return "" if pd.isna(cell) else cell.isoformat()
+    val = str(cell)
+    return "" if val.lower() in _EMPTY_MARKERS else val
+
+def sanitize_frame_str(df):
+    """Column-wise sanitize_cell_str: text columns are cleaned with vectorized ops,
+    only non-text columns fall back to the per-cell rules."""
+    clean = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object or pd.api.types.is_string_dtype(s):
+            txt = s.astype(str).fillna("")
+            clean[col] = txt.mask(txt.str.lower().isin(list(_EMPTY_MARKERS)), "")
+        else:
+            clean[col] = s.map(sanitize_cell_str)
+    return pd.DataFrame(clean, index=df.index)
+
 # -------------------------------------------------
 # KEYWORDS / FILTERS DEL CLIPPING
 # -------------------------------------------------
@@ -232,13 +304,14 @@ MONITORING_TERMS = [
     "Don Sixto", "asambleas mendocinas", "agua pura Mendoza", "no a la mina Mendoza"
 ]
 
-MONITORING_TERMS_NORMALIZED = [normalize_for_match(t) for t in MONITORING_TERMS]
+MONITORING_TERMS_NORMALIZED = minimize_any_match_terms(normalize_for_match(t) for t in MONITORING_TERMS)
+
+def contains_any_normalized(t, terms):
+    """Like contains_any_*_keyword but for text already passed through normalize_for_match."""
+    return bool(t) and any(term in t for term in terms)
 
 def contains_any_monitoring_keyword(text):
-    t = normalize_for_match(text)
-    if not t:
-        return False
-    return any(term in t for term in MONITORING_TERMS_NORMALIZED)
+    return contains_any_normalized(normalize_for_match(text), MONITORING_TERMS_NORMALIZED)
 
 EXCLUDED_TERMS = [
     "Benjamin Vicuña",
@@ -248,13 +321,10 @@ EXCLUDED_TERMS = [
     "mundial 2026",
 ]
 
-EXCLUDED_TERMS_NORMALIZED = [normalize_for_match(t) for t in EXCLUDED_TERMS]
+EXCLUDED_TERMS_NORMALIZED = minimize_any_match_terms(normalize_for_match(t) for t in EXCLUDED_TERMS)
 
 def contains_any_excluded_keyword(text):
-    t = normalize_for_match(text)
-    if not t:
-        return False
-    return any(term in t for term in EXCLUDED_TERMS_NORMALIZED)
+    return contains_any_normalized(normalize_for_match(text), EXCLUDED_TERMS_NORMALIZED)
 # -------------------------------------------------
 # CATEGORIES DEL CLIPPING
 # -------------------------------------------------
@@ -318,7 +388,7 @@ CATEGORY_KEYWORDS = {
 }
 
 CATEGORY_KEYWORDS_NORMALIZED = {
-    cat: [normalize_for_match(k) for k in kws]
+    cat: minimize_any_match_terms(normalize_for_match(k) for k in kws)
     for cat, kws in CATEGORY_KEYWORDS.items()
 }
 
@@ -331,6 +401,8 @@ CATEGORY_PRIORITY = [
     "BHP Corporativo",
 ]
 
+CANONICAL_CATEGORIES_NORMALIZED = {cat: normalize_for_match(cat) for cat in CANONICAL_CATEGORIES}
+
 def categorize_text_with_rules(text):
     t = normalize_for_match(text)
     if not t:
@@ -344,8 +416,7 @@ def normalize_category_from_model_output(raw_text):
     if not raw_text:
         return "Minería en general"
     t = normalize_for_match(raw_text)
-    for cat in CANONICAL_CATEGORIES:
-        cat_norm = normalize_for_match(cat)
+    for cat, cat_norm in CANONICAL_CATEGORIES_NORMALIZED.items():
         if cat_norm == t:
             return cat
     for cat in CANONICAL_CATEGORIES:
@@ -353,15 +424,9 @@ def normalize_category_from_model_output(raw_text):
             return cat
     return "Minería en general"
 
-def build_prompt_from_text(texto):
-    max_chars = 12000
-    t = (texto or "").strip()
-    if len(t) > max_chars:
-        t = t[:max_chars]
-
-    allowed_line = ", ".join(CANONICAL_CATEGORIES)
-
-    prompt = f"""
+CATEGORY_ALLOWED_LINE = ", ".join(CANONICAL_CATEGORIES)
+# Parte fija del prompt de categoría: se arma una sola vez al cargar el módulo
+CATEGORY_PROMPT_PREFIX = f"""
 ROL
 Actúa como un Analista Senior de PR y Asuntos Públicos especializado en minería en Argentina.
 
@@ -387,14 +452,16 @@ CRITERIOS
 INSTRUCCIONES
 1) Analiza la noticia.
 2) Responde SOLO con UNA categoría EXACTA:
-{allowed_line}
+{CATEGORY_ALLOWED_LINE}
 3) Sin explicación, sin texto extra, sin puntuación adicional.
 4) Si no puedes clasificar por falta de información, responde con la categoría que mejor encaje con el tema dominante.
 
 NOTICIA:
-{t}
 """
-    return prompt
+
+def build_prompt_from_text(texto):
+    t = (texto or "").strip()[:MODEL_PROMPT_MAX_CHARS]
+    return CATEGORY_PROMPT_PREFIX + t + "\n"
 
 # -------------------------------------------------
 # CACHES
@@ -409,28 +476,54 @@ try:
 except Exception:
     tag_cache = {}
 
-CACHE_PATH = os.getenv("ARTICLE_CACHE_PATH", "article_cache.json")
+CACHE_PATH = os.getenv("ARTICLE_CACHE_PATH", "article_cache.sqlite")
+CACHE_COMMIT_EVERY = int(os.getenv("ARTICLE_CACHE_COMMIT_EVERY", "100"))
+# el cache persiste entre corridas (actions/cache): entradas más viejas se descartan al abrir
+CACHE_TTL_HOURS = float(os.getenv("ARTICLE_CACHE_TTL_HOURS", "48"))
 MAX_FETCH_WORKERS = int(os.getenv("MAX_FETCH_WORKERS", "3"))
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "15"))
 REQUEST_RETRIES = int(os.getenv("REQUEST_RETRIES", "2"))
 REQUEST_SLEEP_BETWEEN = float(os.getenv("REQUEST_SLEEP_BETWEEN", "0.2"))
 
-def load_cache(path):
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as fh:
-                return json.load(fh) or {}
-        except Exception:
-            return {}
-    return {}
+def open_article_cache(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS articles(url TEXT PRIMARY KEY, body TEXT, fetched_at INTEGER)"
+    )
+    conn.execute("DELETE FROM articles WHERE fetched_at < ?", (int(time.time() - CACHE_TTL_HOURS * 3600),))
+    conn.commit()
+    return conn
+
+article_cache = open_article_cache(CACHE_PATH)
+_article_cache_pending = 0
+
+def cache_get(k):
+    with article_cache_lock:
+        row = article_cache.execute("SELECT body FROM articles WHERE url = ?", (k,)).fetchone()
+    return row[0] if row else None
 
-def save_cache(path, data):
-    try:
-        atomic_write_json(path, data)
-    except Exception as e:
-        logging.warning("Could not save cache to %s: %s", path, e)
+def cache_put(k, body):
+    global _article_cache_pending
+    with article_cache_lock:
+        article_cache.execute(
+            "INSERT OR REPLACE INTO articles(url, body, fetched_at) VALUES (?, ?, ?)",
+            (k, body, int(time.time()))
+        )
+        _article_cache_pending += 1
+        if _article_cache_pending >= CACHE_COMMIT_EVERY:
+            article_cache.commit()
+            _article_cache_pending = 0
 
-article_cache = load_cache(CACHE_PATH)
+def flush_cache():
+    global _article_cache_pending
+    with article_cache_lock:
+        try:
+            article_cache.commit()
+        except sqlite3.Error as e:
+            logging.warning("Could not flush article cache %s: %s", CACHE_PATH, e)
+        _article_cache_pending = 0
 
 def url_key(u):
     return u.strip() if u else ""
@@ -456,6 +549,20 @@ def fetch_html_with_retries(url):
         time.sleep(0.5 + REQUEST_SLEEP_BETWEEN * attempt)
     return None
 
+def extract_paragraphs_text(html):
+    """Texto de todos los <p> del documento, parseado con lxml (mucho más rápido que html.parser)."""
+    if not html:
+        return ""
+    try:
+        if isinstance(html, str):
+            tree = lxml.html.fromstring(html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8"))
+        else:
+            tree = lxml.html.fromstring(html)
+    except (etree.ParserError, ValueError):
+        return ""
+    parts = (" ".join(p.text_content().split()) for p in tree.iter("p"))
+    return " ".join(t for t in parts if t)
+
 def extract_body_from_html(url, html):
     try:
         art = Article(url, language="es")
@@ -470,13 +577,12 @@ def fetch_and_parse(url):
     k = url_key(url)
     if not k:
         return k, ""
-    with article_cache_lock:
-        if k in article_cache:
-            return k, article_cache[k]
+    cached = cache_get(k)
+    if cached is not None:
+        return k, cached
     html = fetch_html_with_retries(url)
     body = extract_body_from_html(url, html) if html else ""
-    with article_cache_lock:
-        article_cache[k] = body
+    cache_put(k, body)
     time.sleep(REQUEST_SLEEP_BETWEEN)
     return k, body
 
@@ -570,9 +676,7 @@ def categorize_row_obtaining_text(row):
         try:
             resp = session.get(url, timeout=REQUEST_TIMEOUT)
             if resp.status_code == 200 and resp.text:
-                soup = BeautifulSoup(resp.text, "html.parser")
-                paragraphs = [p.get_text(separator=" ", strip=True) for p in soup.find_all("p")]
-                body = " ".join(paragraphs)
+                body = extract_paragraphs_text(resp.text)
         except Exception:
             body = ""
 
@@ -621,58 +725,68 @@ def run_actor_task(task):
         logging.exception("Error running actor for %s with query '%s'.", country, query)
         return {"query": query, "country": country, "run": None, "dataset_id": None, "error": str(e)}
 
-actor_results = []
-with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ACTORS) as ex:
-    futures = {ex.submit(run_actor_task, t): t for t in tasks}
-    for fut in as_completed(futures):
-        res = fut.result()
-        if res["error"]:
-            logging.warning("Run failed for %s - %s: %s", res["country"], res["query"], res["error"])
-            continue
-        if not res["dataset_id"]:
-            logging.warning("No dataset generated for %s - %s", res["country"], res["query"])
-            continue
-        actor_results.append(res)
-
-logging.info("Actor executions completed: %d successful / %d total", len(actor_results), len(tasks))
-
 # -------------------------------------------------
-# DESCARGA DATASETS EN PARALELO
+# DESCARGA DEL DATASET DE CADA RUN
 # -------------------------------------------------
 def fetch_dataset_items(entry):
     dataset_id = entry["dataset_id"]
     country = entry["country"]
     query = entry["query"]
     try:
-        items = retry(lambda: apify_client.dataset(dataset_id).list_items().items, max_attempts=4)
+        items = retry(
+            lambda: list(apify_client.dataset(dataset_id).iterate_items(fields=DATASET_FIELDS, clean=True)),
+            max_attempts=4
+        )
         if not items:
             logging.info("No items for dataset %s (%s - %s)", dataset_id, country, query)
             return None
-        df = pd.DataFrame(items)
-        df["country"] = country
-        df["query"] = query
-        df["scraped_at"] = datetime.now(TZ_ARGENTINA).isoformat()
-        return df
+        # Los items se etiquetan en el lugar; el DataFrame se arma una sola vez al final
+        for item in items:
+            item["country"] = country
+            item["query"] = query
+            item["scraped_at"] = RUN_SCRAPED_AT
+        return items
     except Exception:
         logging.exception("Error listing items for dataset %s.", dataset_id)
         return None
 
-all_dfs = []
-with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DATASET_FETCH) as ex:
-    futures = {ex.submit(fetch_dataset_items, r): r for r in actor_results}
+def run_and_fetch(task):
+    """Corre el actor y baja su dataset en la misma tarea: no hay barrera entre ambas fases."""
+    res = run_actor_task(task)
+    if res["error"]:
+        logging.warning("Run failed for %s - %s: %s", res["country"], res["query"], res["error"])
+        return None
+    if not res["dataset_id"]:
+        logging.warning("No dataset generated for %s - %s", res["country"], res["query"])
+        return None
+    return fetch_dataset_items(res)
+
+all_items = []
+tasks_with_items = 0
+with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ACTORS) as ex:
+    futures = {ex.submit(run_and_fetch, t): t for t in tasks}
     for fut in as_completed(futures):
-        df = fut.result()
-        if df is not None and not df.empty:
-            all_dfs.append(df)
+        items = fut.result()
+        if items:
+            tasks_with_items += 1
+            all_items.extend(items)
+
+logging.info("Actor runs + dataset downloads completed: %d with items / %d total", tasks_with_items, len(tasks))
 
-if not all_dfs:
+if not all_items:
     logging.error("No results obtained from any country. Exiting without updating sheet.")
     sys.exit(0)
 
 # -------------------------------------------------
 # BUILD FINAL DATAFRAME
 # -------------------------------------------------
-final_df = pd.concat(all_dfs, ignore_index=True)
+final_df = pd.DataFrame.from_records(all_items)
+del all_items
+
+# country/query repiten unos pocos valores: category los guarda como códigos enteros
+for col in ("country", "query"):
+    if col in final_df.columns:
+        final_df[col] = final_df[col].astype("category")
 
 if "link" in final_df.columns:
     final_df.drop_duplicates(subset=["link"], inplace=True)
@@ -709,7 +823,7 @@ for col in ("tag", "article_body"):
         final_df[col] = ""
 
 # Solo Argentina
-final_df["country"] = final_df["country"].replace({"ar": "Argentina"})
+final_df["country"] = final_df["country"].cat.rename_categories({"ar": "Argentina"})
 
 try:
     final_df["scraped_at"] = pd.to_datetime(final_df["scraped_at"], errors="coerce").dt.strftime("%d/%m/%Y %H:%M").fillna("")
@@ -720,6 +834,14 @@ except Exception:
 #if "date_utc" in final_df.columns:
 #    final_df["semana"] = final_df["date_utc"].apply(format_week_range)
 
+# Un término excluido en título/snippet descarta la fila sin importar el cuerpo:
+# esas filas se sacan antes de bajar artículos (mismo resultado, menos requests)
+meta_norm = (safe_series(final_df, "title") + " " + safe_series(final_df, "snippet")).map(normalize_for_match)
+excluded_by_meta = meta_norm.map(lambda t: contains_any_normalized(t, EXCLUDED_TERMS_NORMALIZED))
+if excluded_by_meta.any():
+    final_df = final_df[~excluded_by_meta].copy()
+    logging.info("Excluded on title/snippet before fetch: %d rows", int(excluded_by_meta.sum()))
+
 # -------------------------------------------------
 # ARTICLE FETCH + PARSE
 # -------------------------------------------------
@@ -727,7 +849,7 @@ links = final_df.get("link", pd.Series([], dtype=str)).dropna().astype(str).uniq
 logging.info(
     "Starting article fetch: %d unique links (cache hits: %d)",
     len(links),
-    sum(1 for l in links if url_key(l) in article_cache)
+    sum(1 for l in links if cache_get(url_key(l)) is not None)
 )
 
 link_to_body = {}
@@ -742,7 +864,7 @@ with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as ex:
             logging.warning("Error fetching/parsing %s: %s", url, e)
             link_to_body[url] = ""
 
-save_cache(CACHE_PATH, article_cache)
+flush_cache()
 
 final_df["link"] = final_df["link"].astype(str)
 final_df["article_body"] = final_df["link"].map(lambda u: link_to_body.get(url_key(u), "")).fillna("")
@@ -756,8 +878,10 @@ combined_text = (
     safe_series(final_df, "article_body")
 )
 
-mask_monitoring = combined_text.apply(contains_any_monitoring_keyword)
-mask_excluded = ~combined_text.apply(contains_any_excluded_keyword)
+# normalizamos una sola vez y reutilizamos para ambos chequeos
+combined_norm = combined_text.map(normalize_for_match)
+mask_monitoring = combined_norm.map(lambda t: contains_any_normalized(t, MONITORING_TERMS_NORMALIZED))
+mask_excluded = ~combined_norm.map(lambda t: contains_any_normalized(t, EXCLUDED_TERMS_NORMALIZED))
 
 mask = mask_monitoring & mask_excluded
 
@@ -843,16 +967,7 @@ except Exception as e:
 # -------------------------------------------------
 # SENTIMENT (OPCIONAL)
 # -------------------------------------------------
-def analizar_noticia(url):
-    try:
-        response = session.get(url, timeout=REQUEST_TIMEOUT)
-        if response.status_code != 200 or not response.text:
-            return "NEUTRO"
-        soup = BeautifulSoup(response.text, "html.parser")
-        paragraphs = [p.get_text() for p in soup.find_all("p")]
-        texto = " ".join(paragraphs)
-
-        prompt = f"""
+SENTIMENT_PROMPT_PREFIX = f"""
 ROL
 Actúa como Analista Senior de PR/Reputación. Tu única tarea es determinar si la noticia
 es POSITIVA, NEGATIVA o NEUTRA respecto a la reputación de {COMPANY_NAME} como empresa/minera.
@@ -864,9 +979,17 @@ INSTRUCCIONES
 - Si no puedes clasificar por falta de información, responde EXACTAMENTE: NEUTRO
 
 NOTICIA:
-{texto}
 """
 
+def analizar_noticia(url):
+    try:
+        response = session.get(url, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200 or not response.text:
+            return "NEUTRO"
+        texto = extract_paragraphs_text(response.text)
+
+        prompt = SENTIMENT_PROMPT_PREFIX + texto[:MODEL_PROMPT_MAX_CHARS] + "\n"
+
         with llm_semaphore:
             resp = model.generate_content(prompt)
 
@@ -893,23 +1016,42 @@ final_df = final_df.drop_duplicates(subset=["title", "snippet"])
 SHEET_RANGE = "2026!A:K"
 HEADER = header
 
-# 1) Read current sheet values (if any)
+SHEET_TAB = SHEET_RANGE.split("!")[0]
+
+
+def sheet_col_letter(idx):
+    return chr(ord("A") + idx)
+
+
+def batch_get_values(ranges):
+    result = sheet_service.values().batchGet(spreadsheetId=SPREADSHEET_ID, ranges=ranges).execute()
+    value_ranges = [vr.get("values", []) for vr in result.get("valueRanges", [])]
+    return value_ranges + [[] for _ in range(len(ranges) - len(value_ranges))]
+
+
+# 1) Read header row + link column in one round-trip (the other columns aren't needed for dedup)
+expected_link_idx = HEADER.index("link")
+link_col = sheet_col_letter(expected_link_idx)
+sheet_read_failed = False
 try:
-    result = sheet_service.values().get(spreadsheetId=SPREADSHEET_ID, range=SHEET_RANGE).execute()
-    values = result.get("values", [])
-    logging.info("Read %d rows from sheet (including header if present).", len(values))
+    header_values, link_values = batch_get_values(
+        [f"{SHEET_TAB}!1:1", f"{SHEET_TAB}!{link_col}2:{link_col}"]
+    )
+    logging.info("Read header + %d link cells from sheet.", len(link_values))
 except HttpError as e:
     logging.exception("Failed to read existing sheet (sanitized): %s", e)
-    values = []
+    header_values, link_values = [], []
+    sheet_read_failed = True
 except Exception as e:
     logging.exception("Failed to read existing sheet (sanitized): %s", e)
-    values = []
+    header_values, link_values = [], []
+    sheet_read_failed = True
 
 # 2) Build set of existing links from the sheet to avoid duplicate appends
-existing_links_set = set()
+existing_links_set = frozenset()
 sheet_has_header = False
-if values and len(values) >= 1:
-    header_row = values[0]
+header_row = header_values[0] if header_values else []
+if header_row:
     link_idx = None
     try:
         link_idx = header_row.index("link")
@@ -921,73 +1063,42 @@ if values and len(values) >= 1:
             sheet_has_header = True
         else:
             if len(header_row) == len(HEADER):
-                try:
-                    link_idx = HEADER.index("link")
-                    sheet_has_header = True
-                except Exception:
-                    link_idx = None
+                link_idx = expected_link_idx
+                sheet_has_header = True
+
+    if link_idx is not None and link_idx != expected_link_idx:
+        # sheet columns are in a different order: re-read the right column
+        col = sheet_col_letter(link_idx)
+        try:
+            link_values = batch_get_values([f"{SHEET_TAB}!{col}2:{col}"])[0]
+        except Exception as e:
+            logging.exception("Failed to read link column (sanitized): %s", e)
+            link_idx = None
 
     if link_idx is not None:
-        for r in values[1:]:
-            try:
-                if len(r) > link_idx:
-                    v = r[link_idx].strip()
-                    if v:
-                        existing_links_set.add(v)
-            except Exception:
-                continue
+        existing_links_set = frozenset(
+            v for v in (str(r[0]).strip() for r in link_values if r) if v
+        )
 
-sheet_empty = len(values) == 0
+# a failed read says nothing about the sheet: don't treat it as empty (no header write)
+sheet_empty = not sheet_read_failed and not header_row and not link_values
 
 # 3) Ensure final_df has correct columns and sanitized values
 for col in HEADER:
     if col not in final_df.columns:
         final_df[col] = ""
 
+# categorical columns back to plain objects so blanks can be filled in
+final_df = final_df.astype({c: object for c in final_df.select_dtypes("category").columns})
 final_df = final_df.replace([np.nan, pd.NaT, None], "").replace([np.inf, -np.inf], "")
 
-rows_to_add = []
-new_links_count = 0
-for row in final_df[HEADER].values.tolist():
-    row_map = dict(zip(HEADER, row))
-    link = str(row_map.get("link", "")).strip()
-    if not link:
-        continue
-    if link in existing_links_set:
-        continue
-
-    sanitized_cells = []
-    for cell in row:
-        if isinstance(cell, (np.integer,)):
-            val = int(cell)
-        elif isinstance(cell, (np.floating,)):
-            fv = float(cell)
-            if math.isnan(fv) or math.isinf(fv):
-                val = ""
-            else:
-                val = fv
-        elif isinstance(cell, (np.bool_, bool)):
-            val = bool(cell)
-        else:
-            try:
-                import pandas as _pd
-                if isinstance(cell, _pd.Timestamp):
-                    if pd.isna(cell):
-                        val = ""
-                    else:
-                        val = cell.isoformat()
-                else:
-                    val = "" if cell is None else str(cell)
-            except Exception:
-                val = "" if cell is None else str(cell)
-
-        if isinstance(val, str) and val.lower() in ("nan", "nat", "none"):
-            val = ""
-        sanitized_cells.append(val)
+# Vectorized filter: drop empty links, links already in the sheet and repeats within this run
+link_keys = final_df["link"].astype(str).str.strip()
+new_mask = link_keys.ne("") & ~link_keys.isin(existing_links_set) & ~link_keys.duplicated()
+logging.info("Rows not yet in sheet: %d of %d", int(new_mask.sum()), len(final_df))
 
-    rows_to_add.append([str(c) for c in sanitized_cells])
-    existing_links_set.add(link)
-    new_links_count += 1
+rows_to_add = sanitize_frame_str(final_df.loc[new_mask, HEADER]).to_numpy(dtype=object).tolist()
+new_links_count = len(rows_to_add)
 
 if new_links_count == 0 and not sheet_empty:
     logging.info("No new rows to add. Exiting without touching the sheet.")
@@ -1012,34 +1123,39 @@ def append_with_retry(batch, max_attempts=5, base_delay=1.5):
     while True:
         try:
             return sheets_append_batch(batch)
-        except HttpError:
+        except HttpError as e:
             attempt += 1
             if attempt >= max_attempts:
                 logging.exception("Failed to append batch to Sheets after %d attempts (sanitized).", attempt)
                 raise
-            sleep_for = min(60, base_delay * (2 ** (attempt - 1))) + random.random() * 0.5
+            hinted = retry_after_seconds(e)
+            backoff = hinted if hinted is not None else base_delay * (2 ** (attempt - 1))
+            sleep_for = min(RETRY_MAX_DELAY, backoff) + random.random() * 0.5
             logging.warning(
                 "HttpError appending to Sheets (attempt %d/%d) — retrying in %.1fs",
                 attempt, max_attempts, sleep_for
             )
             time.sleep(sleep_for)
-        except Exception:
+        except Exception as e:
             attempt += 1
             if attempt >= max_attempts:
                 logging.exception("Failed to append batch to Sheets after %d attempts (sanitized).", attempt)
                 raise
-            sleep_for = min(60, base_delay * (2 ** (attempt - 1))) + random.random() * 0.5
+            hinted = retry_after_seconds(e)
+            backoff = hinted if hinted is not None else base_delay * (2 ** (attempt - 1))
+            sleep_for = min(RETRY_MAX_DELAY, backoff) + random.random() * 0.5
             logging.warning(
                 "Error appending to Sheets (attempt %d/%d) — retrying in %.1fs",
                 attempt, max_attempts, sleep_for
             )
             time.sleep(sleep_for)
 
-# if sheet empty, write header first
-if sheet_empty:
-    logging.info("Sheet empty: writing header first.")
+# if sheet empty, the header travels with the first batch (one write instead of two)
+pending_header = [HEADER] if sheet_empty else []
+if pending_header and not rows_to_add:
+    logging.info("Sheet empty and nothing to append: writing header only.")
     try:
-        append_with_retry([HEADER])
+        append_with_retry(pending_header)
     except Exception:
         logging.exception("Could not write header to sheet (sanitized).")
         raise
@@ -1049,7 +1165,8 @@ total_added = 0
 for i in range(0, len(rows_to_add), BATCH_SIZE):
     batch = rows_to_add[i:i + BATCH_SIZE]
     try:
-        append_with_retry(batch)
+        append_with_retry(pending_header + batch)
+        pending_header = []
         total_added += len(batch)
         logging.info("Appended batch %d..%d (rows=%d) to sheet.", i, i + len(batch) - 1, len(batch))
     except Exception:
@@ -1,11 +1,12 @@
 from datetime import datetime
+from zoneinfo import ZoneInfo
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.oauth2 import service_account
 from apify_client import ApifyClient
 import pandas as pd
 import numpy as np
-import pytz
 import json
 import logging
 import os
@@ -31,14 +32,19 @@ QUERIES = os.getenv("QUERIES", "youtube,instagram,facebook").split(",")
 
 MAX_ITEMS = int(os.getenv("MAX_ITEMS", "500"))
 TIME_PERIOD = os.getenv("TIME_PERIOD", "last_day")
-TZ_ARGENTINA = pytz.timezone("America/Argentina/Buenos_Aires")
+APPEND_BATCH_ROWS = int(os.getenv("APPEND_BATCH_ROWS", "5000"))
+# runs de actor en paralelo; por defecto uno por tarea (query x país), con techo de 8
+MAX_CONCURRENT_ACTORS = int(os.getenv("MAX_CONCURRENT_ACTORS", "8"))
+# Solo los campos del actor que usa el pipeline (el resto no viaja por la red)
+DATASET_FIELDS = ["title", "link", "domain", "source", "tier", "snippet", "date_utc"]
+TZ_ARGENTINA = ZoneInfo("America/Argentina/Buenos_Aires")
 
 # --- CLIENTS ---
 creds = service_account.Credentials.from_service_account_info(
     json.loads(GOOGLE_CREDENTIALS_ENV),
     scopes=SCOPES
 )
-sheet_service = build('sheets', 'v4', credentials=creds).spreadsheets()
+sheet_service = build('sheets', 'v4', credentials=creds, cache_discovery=False).spreadsheets()
 apify_client = ApifyClient(APIFY_TOKEN)
 
 # --- HELPERS ---
@@ -49,6 +55,13 @@ def normalize_link(url):
     url = re.sub(r'[?#].*$', '', url)
     return url.rstrip('/')
 
+_FLOAT_TYPES = (float, np.floating)
+
+def sanitize_cell_str(val):
+    if val is None or (isinstance(val, _FLOAT_TYPES) and np.isnan(val)):
+        return ''
+    return str(val)
+
 def retry(fn, max_attempts=5):
     for i in range(max_attempts):
         try:
@@ -59,6 +72,19 @@ def retry(fn, max_attempts=5):
                 raise
             time.sleep(2 ** i)
 
+def retry_transient_http(fn, max_attempts=5):
+    # el append no es idempotente: solo se reintenta si Sheets respondió 429/5xx;
+    # cualquier otro error (400/403, timeouts) se propaga sin reintentar
+    for i in range(max_attempts):
+        try:
+            return fn()
+        except HttpError as e:
+            status = getattr(e.resp, "status", None)
+            if status not in (429, 500, 502, 503, 504) or i == max_attempts - 1:
+                raise
+            logging.warning("Attempt %d/%d failed (HTTP %s): %s", i + 1, max_attempts, status, e)
+            time.sleep(2 ** i)
+
 # --- RUN ACTORS ---
 tasks = [
     {"query": q.strip(), "country": c.strip()}
@@ -92,47 +118,47 @@ def run_actor(task):
         logging.error("Actor failed for %s - %s: %s", task["country"], task["query"], e)
         return {"dataset_id": None, "country": task["country"], "query": task["query"]}
 
-results = []
-with ThreadPoolExecutor(max_workers=4) as ex:
-    futures = [ex.submit(run_actor, t) for t in tasks]
-    for f in as_completed(futures):
-        r = f.result()
-        if r["dataset_id"]:
-            results.append(r)
-
-logging.info("Actor runs completed: %d successful / %d total", len(results), len(tasks))
-
-if not results:
-    logging.error("No results from any actor. Exiting.")
-    sys.exit(0)
-
 # --- FETCH DATA ---
 def fetch_dataset(entry):
     try:
-        items = apify_client.dataset(entry["dataset_id"]).list_items().items
+        items = list(
+            apify_client.dataset(entry["dataset_id"]).iterate_items(fields=DATASET_FIELDS, clean=True)
+        )
         if not items:
             logging.info("Empty dataset for %s - %s", entry["country"], entry.get("query", ""))
             return None
-        df = pd.DataFrame(items)
-        df["country"] = entry["country"]
-        return df
+        for item in items:
+            item["country"] = entry["country"]
+        return items
     except Exception as e:
         logging.warning("Failed fetching dataset %s: %s", entry["dataset_id"], e)
         return None
 
-dfs = []
-with ThreadPoolExecutor(max_workers=6) as ex:
-    futures = [ex.submit(fetch_dataset, r) for r in results]
+def run_and_fetch(task):
+    # actor + dataset en la misma tarea, sin esperar a que terminen todos los runs
+    r = run_actor(task)
+    if not r["dataset_id"]:
+        return None
+    return fetch_dataset(r)
+
+# registros crudos de todos los datasets; el DataFrame se arma una sola vez
+all_items = []
+with_data = 0
+with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONCURRENT_ACTORS, len(tasks)))) as ex:
+    futures = [ex.submit(run_and_fetch, t) for t in tasks]
     for f in as_completed(futures):
-        df = f.result()
-        if df is not None and not df.empty:
-            dfs.append(df)
+        items = f.result()
+        if items:
+            with_data += 1
+            all_items.extend(items)
+
+logging.info("Actor runs + dataset fetch completed: %d with data / %d total", with_data, len(tasks))
 
-if not dfs:
+if not all_items:
     logging.error("No data fetched from datasets. Exiting.")
     sys.exit(0)
 
-final_df = pd.concat(dfs, ignore_index=True)
+final_df = pd.DataFrame.from_records(all_items)
 
 # --- CLEAN ---
 if 'link' in final_df.columns:
@@ -146,10 +172,14 @@ final_df['country'] = final_df['country'].replace({'ar': 'Argentina', 'cl': 'Chi
 # --- FILTER ---
 pattern = re.compile(r"(youtube|instagram|facebook|roblox)", re.IGNORECASE)
 
-title_col = final_df['title'].astype(str) if 'title' in final_df.columns else pd.Series([''] * len(final_df))
-snippet_col = final_df['snippet'].astype(str) if 'snippet' in final_df.columns else pd.Series([''] * len(final_df))
+def text_col(col):
+    if col in final_df.columns:
+        return final_df[col].fillna('').astype(str)
+    return pd.Series('', index=final_df.index, dtype=object)
 
-mask = title_col.str.contains(pattern, na=False) | snippet_col.str.contains(pattern, na=False)
+# un solo escaneo del regex sobre título + snippet concatenados
+haystack = text_col('title').str.cat(text_col('snippet'), sep=' ')
+mask = haystack.str.contains(pattern, na=False)
 before = len(final_df)
 final_df = final_df[mask].copy()
 logging.info("Filter: %d -> %d rows", before, len(final_df))
@@ -159,14 +189,12 @@ if final_df.empty:
     sys.exit(0)
 
 # --- FORMAT FIXES ---
-def format_date_utc(value):
-    dt = pd.to_datetime(value, utc=True, errors='coerce')
-    if pd.isna(dt):
-        return ''
-    return dt.tz_convert(TZ_ARGENTINA).strftime('%d/%m/%Y')
-
 if 'date_utc' in final_df.columns:
-    final_df['date_utc'] = final_df['date_utc'].apply(format_date_utc)
+    # una sola conversión vectorizada para toda la columna (antes pd.to_datetime por fila)
+    # format='mixed': cada valor se interpreta por separado, como en el parseo por fila
+    # (sin esto pandas infiere el formato del primero y deja NaT el resto)
+    dt = pd.to_datetime(final_df['date_utc'], utc=True, errors='coerce', format='mixed')
+    final_df['date_utc'] = dt.dt.tz_convert(TZ_ARGENTINA).dt.strftime('%d/%m/%Y').fillna('')
 else:
     final_df['date_utc'] = ''
 
@@ -177,37 +205,30 @@ HEADER = ['date_utc', 'country', 'title', 'link', 'domain', 'source', 'snippet',
 final_df = final_df.reindex(columns=HEADER, fill_value='')
 
 # --- READ EXISTING ---
+# solo la columna de links (D, sin encabezado): no hace falta bajar toda la hoja
 try:
     values = sheet_service.values().get(
         spreadsheetId=SPREADSHEET_ID,
-        range="Competencia!A:L"
+        range="Competencia!D2:D",
+        fields="values"
     ).execute().get("values", [])
 except Exception as e:
     logging.error("Failed reading sheet: %s", e)
     values = []
 
-existing_links = set()
-if values:
-    for r in values[1:]:
-        if len(r) > 3:
-            existing_links.add(normalize_link(r[3]))
+existing_links = {normalize_link(r[0]) for r in values if r}
+existing_links.discard('')
 
 logging.info("Existing links in sheet: %d", len(existing_links))
 
 # --- PREPARE ROWS ---
+link_idx = HEADER.index('link')
 rows = []
-for _, row in final_df.iterrows():
-    link = normalize_link(str(row.get('link', '')))
+for row in final_df.to_numpy(dtype=object):
+    link = normalize_link(str(row[link_idx]))
     if not link or link in existing_links:
         continue
-    sanitized = []
-    for c in HEADER:
-        val = row[c]
-        if val is None or (isinstance(val, float) and np.isnan(val)):
-            sanitized.append('')
-        else:
-            sanitized.append(str(val))
-    rows.append(sanitized)
+    rows.append([sanitize_cell_str(c) for c in row])
     existing_links.add(link)
 
 if not rows:
@@ -215,15 +236,23 @@ if not rows:
     sys.exit(0)
 
 # --- APPEND ---
-try:
-    sheet_service.values().append(
+# en tandas, para no mandar un único POST gigante (tope de 10MB por request)
+def append_batch(batch):
+    return sheet_service.values().append(
         spreadsheetId=SPREADSHEET_ID,
         range="Competencia!A1",
         valueInputOption="RAW",
         insertDataOption="INSERT_ROWS",
-        body={"values": rows}
+        body={"values": batch}
     ).execute()
-    logging.info("✅ %d rows added.", len(rows))
+
+added = 0
+try:
+    for i in range(0, len(rows), APPEND_BATCH_ROWS):
+        batch = rows[i:i + APPEND_BATCH_ROWS]
+        retry_transient_http(lambda: append_batch(batch))
+        added += len(batch)
+    logging.info("✅ %d rows added.", added)
 except Exception as e:
-    logging.error("Failed appending to sheet: %s", e)
+    logging.error("Failed appending to sheet after %d rows: %s", added, e)
     sys.exit(1)
@@ -21,12 +21,15 @@ import re
 import unicodedata
 import time
 from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
-import pytz
 import requests
 from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 from requests.adapters import HTTPAdapter, Retry
 
 from apify_client import ApifyClient
@@ -34,6 +37,8 @@ from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from retry_hints import retry_after_seconds, RETRY_MAX_DELAY
+
 # --- Gemini ---
 import google.generativeai as genai
 
@@ -69,6 +74,8 @@ sheet = service.spreadsheets()
 # Inicializar Apify
 apify_client = ApifyClient(APIFY_TOKEN)
 ACTOR_ID = "easyapi/google-news-scraper"
+# Solo los campos del actor que usa el pipeline (el resto no viaja por la red)
+DATASET_FIELDS = ["date_utc", "title", "link", "domain", "source", "snippet", "sentiment"]
 
 # Inicializar Gemini
 genai.configure(api_key=GEMINI_API_KEY)
@@ -84,7 +91,7 @@ HEADER = ["date_utc", "title", "link", "source", "snippet", "sentiment", "scrape
 QUERIES = ["irsa"]
 
 # Zona horaria de Argentina
-TZ_ARG = pytz.timezone("America/Argentina/Buenos_Aires")
+TZ_ARG = ZoneInfo("America/Argentina/Buenos_Aires")
 
 # HTTP base
 UA = (
@@ -93,62 +100,112 @@ UA = (
 )
 DEFAULT_TIMEOUT = 12  # s
 MIN_HTML_BYTES = 256  # rechaza respuestas vacías
-MAX_THREADS_HARD = 16  # techo superior de threads
+MAX_HTML_BYTES = int(os.getenv("MAX_HTML_BYTES", str(512 * 1024)))  # tope de lectura por página
+STREAM_CHUNK_BYTES = 16 * 1024
+MAX_THREADS_HARD = int(os.getenv("MAX_THREADS_HARD", "64"))  # techo de threads de red (esperan I/O, no CPU)
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", "4"))  # hilos para Gemini (cuota)
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "8"))  # notas por llamada a Gemini
+MAX_PER_HOST = int(os.getenv("MAX_PER_HOST", "4"))  # requests simultáneos contra un mismo sitio
 
-# Thread-local session para seguridad en paralelo
 import threading
-_tls = threading.local()
-
-def get_session() -> requests.Session:
-    sess = getattr(_tls, "session", None)
-    if sess is None:
-        sess = requests.Session()
-        retries = Retry(
-            total=3,
-            backoff_factor=0.6,
-            status_forcelist=(429, 500, 502, 503, 504),
-            allowed_methods=frozenset(["GET", "HEAD"]),
-        )
-        adapter = HTTPAdapter(max_retries=retries)
-        sess.mount("http://", adapter)
-        sess.mount("https://", adapter)
-        _tls.session = sess
-    return sess
+
+# HTML bajado al verificar menciones, reutilizado luego para el sentimiento:
+# url -> (bytes leídos, página completa?)
+_page_html_cache: Dict[str, tuple] = {}
+_page_html_cache_lock = threading.Lock()
+
+# Semáforo por host: con muchos hilos, varias notas del mismo diario no
+# salen todas juntas contra el mismo servidor (evita 429 y reintentos)
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+
+def host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc.lower()
+    with _host_slots_lock:
+        sem = _host_slots.get(host)
+        if sem is None:
+            sem = _host_slots[host] = threading.BoundedSemaphore(max(1, MAX_PER_HOST))
+    return sem
+
+# Una sola Session compartida por todos los hilos: el pool de urllib3 es thread-safe,
+# así las conexiones (keep-alive/TLS) se reutilizan entre hilos y no por hilo
+session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=MAX_THREADS_HARD,  # hosts distintos con pool abierto
+    pool_maxsize=max(1, MAX_PER_HOST),  # conexiones por host (host_slot limita a MAX_PER_HOST)
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.6,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+    ),
+)
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
 
 # ---------------------------
 # Helpers
 # ---------------------------
+MULTI_SLASH_RE = re.compile(r"/{2,}")
+
 def canonical_url(u: str) -> str:
     """Remueve parámetros de tracking para mejorar dedupe y normaliza host/path."""
     try:
         p = urlparse(u.strip())
-        q = [
-            (k, v)
-            for k, v in parse_qsl(p.query, keep_blank_values=True)
-            if not k.lower().startswith(("utm_", "fbclid", "gclid"))
-        ]
         netloc = p.netloc.replace(":80", "").replace(":443", "")
         if netloc.startswith("www."):
             netloc = netloc[4:]
         path = p.path or "/"
-        path = re.sub(r"/{2,}", "/", path)  # compactar múltiples slash
-        query = urlencode(q, doseq=True)
+        if "//" in path:
+            path = MULTI_SLASH_RE.sub("/", path)  # compactar múltiples slash
+        query = ""
+        if p.query:  # la mayoría de los links finales no traen query: sin parse_qsl/urlencode
+            q = [
+                (k, v)
+                for k, v in parse_qsl(p.query, keep_blank_values=True)
+                if not k.lower().startswith(("utm_", "fbclid", "gclid"))
+            ]
+            query = urlencode(q, doseq=True)
         return urlunparse((p.scheme or "https", netloc, path, "", query, ""))
     except Exception:
         return u
 
+DASHES_RE = re.compile(r"[\u2010-\u2015\u2212\uFE58\uFE63\uFF0D-]+")
+WHITESPACE_RE = re.compile(r"\s+")
+
 def normalize_text(s: str) -> str:
     """Normaliza acentos/espacios/guiones para robustecer matching."""
     if not isinstance(s, str):
         return ""
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(c for c in s if not unicodedata.combining(c))
-    s = re.sub(r"[\u2010-\u2015\u2212\uFE58\uFE63\uFF0D-]+", "-", s)  # guiones raros -> '-'
-    s = re.sub(r"\s+", " ", s)
+    if not s.isascii():  # NFKD + quitar diacríticos no cambia nada en ASCII puro
+        s = unicodedata.normalize("NFKD", s)
+        s = "".join(c for c in s if not unicodedata.combining(c))
+    s = DASHES_RE.sub("-", s)  # guiones raros -> '-'
+    s = WHITESPACE_RE.sub(" ", s)
     return s.lower().strip()
 
 PATRON_NOMBRE = re.compile(r"irsa", re.IGNORECASE)
 
+def raw_name_pattern(name: str) -> "re.Pattern[bytes]":
+    """
+    Patrón en bytes para `name` que también acepta cada letra acentuada (UTF-8 o
+    Latin-1, precompuesta o con marca combinante) o escrita como entidad HTML
+    (&aacute;, &#225;): lo que normalize_text pliega después en el texto visible.
+    """
+    # letra base (+ marca combinante U+0300-036F) | À-ÿ en UTF-8 o Latin-1 |
+    # entidad con nombre de esa letra (&aacute;) | entidad numérica de À-ÿ (&#225; / &#xE1;)
+    letra = (rb"(?:%(c)s(?:\xcc[\x80-\xbf]|\xcd[\x80-\xaf])?|\xc3[\x80-\xbf]|[\xc0-\xff]"
+             rb"|&%(c)s[a-z]+;|&#(?:19[2-9]|2[0-4][0-9]|25[0-5]);|&#x[c-f][0-9a-f];)")
+    return re.compile(b"".join(letra % {b"c": re.escape(c.encode())} for c in name), re.IGNORECASE)
+
+# Versión cruda (bytes) para detectar candidatos mientras se descarga el HTML
+PATRON_NOMBRE_BYTES = raw_name_pattern("irsa")
+RAW_MATCH_OVERLAP = 128  # bytes re-escaneados entre chunks por si el match queda partido (entidades incluidas)
+
+NETLOC_RE = r"^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)"
+DEFAULT_PORT_RE = r":(?:80|443)(?![0-9])"
+WWW_PREFIX_RE = r"^www\."
+
 def ensure_source_column(df: pd.DataFrame) -> pd.DataFrame:
     """Asegura columna 'source'."""
     if "source" in df.columns and df["source"].notna().any():
@@ -156,171 +213,315 @@ def ensure_source_column(df: pd.DataFrame) -> pd.DataFrame:
     if "domain" in df.columns:
         df = df.rename(columns={"domain": "source"})
     else:
-        def _host(x: str) -> str:
-            try:
-                host = urlparse(x).netloc
-                host = host.replace(":80", "").replace(":443", "")
-                return host[4:] if host.startswith("www.") else host
-            except Exception:
-                return ""
-        df["source"] = df.get("link", pd.Series(dtype=str)).apply(lambda x: _host(x) if isinstance(x, str) else "")
+        # host del link con operaciones vectorizadas de pandas (sin urlparse por fila)
+        link = df["link"] if "link" in df.columns else pd.Series("", index=df.index, dtype=object)
+        host = link.where(link.map(type) == str, "").str.extract(NETLOC_RE, expand=False).fillna("")
+        host = host.str.replace(DEFAULT_PORT_RE, "", regex=True).str.replace(WWW_PREFIX_RE, "", regex=True)
+        df["source"] = host
     return df
 
-def is_probably_html(url: str) -> bool:
-    """Evita PDFs/imagenes antes de descargar cuerpo completo."""
-    try:
-        head = get_session().head(url, timeout=DEFAULT_TIMEOUT, headers={"User-Agent": UA}, allow_redirects=True)
-        ctype = head.headers.get("Content-Type", "").lower()
-        if "text/html" in ctype or ctype == "":
-            return True
+def is_html_response(resp: requests.Response) -> bool:
+    """
+    Headers del GET ya abierto (sin HEAD previo): HTML o sin declarar, y sin un
+    Content-Length declarado por debajo de MIN_HTML_BYTES (se corta sin leer el cuerpo).
+    """
+    ctype = resp.headers.get("Content-Type", "").lower()
+    if ctype and "html" not in ctype:
         return False
-    except Exception:
-        # si falla HEAD, seguimos y dejamos que GET lo determine
-        return True
+    clen = resp.headers.get("Content-Length", "")
+    # Con Content-Encoding el largo es el comprimido: no sirve para comparar
+    if clen.isdigit() and not resp.headers.get("Content-Encoding"):
+        return int(clen) >= MIN_HTML_BYTES
+    return True
 
-def page_mentions_irsa(url: str) -> bool:
-    """Verifica que el cuerpo/título mencione a  irsa."""
+MENTION_TAGS = ("title", "h1", "h2", "h3", "p")
+
+def _html_mentions(content: bytes) -> bool:
+    """Parsea el HTML (completo o parcial) y busca PATRON_NOMBRE en título/encabezados/párrafos."""
     try:
-        if not is_probably_html(url):
-            return False
+        tree = lxml.html.fromstring(content)
+    except (etree.ParserError, ValueError):
+        return False
 
-        resp = get_session().get(url, timeout=DEFAULT_TIMEOUT, headers={"User-Agent": UA})
-        if resp.status_code != 200:
-            return False
-        if not resp.content or len(resp.content) < MIN_HTML_BYTES:
-            return False
+    # Un solo recorrido del árbol (iter con todos los tags) en C
+    textos = [" ".join(el.itertext()) for el in tree.iter(*MENTION_TAGS)]
+
+    text = normalize_text(" ".join(textos))
+    return bool(PATRON_NOMBRE.search(text))
 
-        soup = BeautifulSoup(resp.content, "html.parser")
+def remember_page_html(url: str, content: bytes, *, complete: bool) -> None:
+    with _page_html_cache_lock:
+        _page_html_cache[url] = (content, complete)
 
-        textos: List[str] = []
-        for tag in ("title", "h1", "h2", "h3", "p"):
-            for el in soup.find_all(tag):
-                textos.append(el.get_text(separator=" ", strip=True))
+def pop_page_html(url: str) -> Optional[tuple]:
+    with _page_html_cache_lock:
+        return _page_html_cache.pop(url, None)
 
-        text = normalize_text(" ".join(textos))
-        return bool(PATRON_NOMBRE.search(text))
+def page_mentions_irsa(url: str) -> bool:
+    """Verifica que el cuerpo/título mencione a  irsa."""
+    try:
+        # Streaming: ante el primer match crudo en bytes confirmamos con el parser
+        # y, si aparece en el texto visible, cortamos sin bajar el resto de la página.
+        with host_slot(url), session.get(url, timeout=DEFAULT_TIMEOUT, headers={"User-Agent": UA}, stream=True) as resp:
+            # El Content-Type llega con los headers del GET: PDFs/imágenes se cortan sin leer el cuerpo
+            if resp.status_code != 200 or not is_html_response(resp):
+                return False
+            buf = bytearray()
+            complete = False
+            raw_hit = False  # algún match crudo en bytes en toda la descarga
+            for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_BYTES):
+                if not chunk:
+                    continue
+                scan_from = max(0, len(buf) - RAW_MATCH_OVERLAP)
+                buf.extend(chunk)
+                if PATRON_NOMBRE_BYTES.search(buf, scan_from):
+                    raw_hit = True
+                    if _html_mentions(bytes(buf)):
+                        remember_page_html(url, bytes(buf), complete=False)
+                        return True
+                if len(buf) >= MAX_HTML_BYTES:
+                    break
+            else:
+                complete = True
+
+        # Sin el nombre (ni acentuado ni como entidad) en los bytes crudos no puede estar
+        # en el texto visible: no se parsea
+        if not raw_hit or len(buf) < MIN_HTML_BYTES:
+            return False
+        content = bytes(buf)
+        if _html_mentions(content):
+            remember_page_html(url, content, complete=complete)
+            return True
+        return False
     except Exception as e:
         log.debug(f"Error al procesar {url}: {e}")
         return False
 
-def prefilter_row_mentions(row: pd.Series) -> bool:
-    """Prefiltro barato usando los campos del actor (sin salir a la web)."""
-    for col in ("title", "snippet"):
-        if col in row and isinstance(row[col], str) and row[col]:
-            s = normalize_text(row[col])
-            if PATRON_NOMBRE.search(s):
-                return True
-    return False
-
-def list_all_items(dataset_id: str, batch: int = 1000) -> List[dict]:
-    """Paginar datasets grandes de Apify."""
-    items: List[dict] = []
-    offset = 0
-    while True:
-        page = apify_client.dataset(dataset_id).list_items(limit=batch, offset=offset)
-        part = page.items or []
-        items.extend(part)
-        if len(part) < batch:
-            break
-        offset += batch
-    return items
+COMBINING_MARKS_RE = re.compile("[\u0300-\u036f]")
+
+def prefilter_mentions(df: pd.DataFrame) -> pd.Series:
+    """Prefiltro barato y vectorizado sobre los campos del actor (sin salir a la web)."""
+    cols = [df[c].fillna("").astype(str) for c in ("title", "snippet") if c in df.columns]
+    if not cols:
+        return pd.Series(False, index=df.index)
+    # Un solo escaneo sobre título + snippet, con el mismo plegado que normalize_text
+    # (NFKD sin diacríticos); el patrón ya es case-insensitive
+    haystack = cols[0].str.cat(cols[1:], sep=" ") if len(cols) > 1 else cols[0]
+    haystack = haystack.str.normalize("NFKD").str.replace(COMBINING_MARKS_RE, "", regex=True)
+    return haystack.str.contains(PATRON_NOMBRE, na=False)
+
+def list_all_items(dataset_id: str) -> List[dict]:
+    """Items del dataset de Apify (iterate_items pagina por dentro, sin listas intermedias por página)."""
+    return list(apify_client.dataset(dataset_id).iterate_items(fields=DATASET_FIELDS, clean=True))
 
 # ---------------------------
 # Utilidades de texto/HTML para sentimiento (Gemini)
 # ---------------------------
-VISIBLE_TAGS = {"p", "h1", "h2", "h3", "li"}
+VISIBLE_TAGS = ("p", "h1", "h2", "h3", "li")
+# str ya decodificado: se fuerza utf-8 para que lxml ignore el charset declarado en la página
+_UTF8_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
 
-def extract_visible_text(html: str, max_chars: int = 5000) -> str:
+def _visible_blocks(html: str | bytes):
+    """Textos de VISIBLE_TAGS en orden de documento (lxml en C; BeautifulSoup si lxml falla)."""
+    try:
+        if isinstance(html, str):
+            tree = lxml.html.fromstring(html.encode("utf-8"), parser=_UTF8_HTML_PARSER)
+        else:
+            tree = lxml.html.fromstring(html)
+        for el in tree.iter(*VISIBLE_TAGS):
+            yield " ".join(s.strip() for s in el.itertext() if s.strip())
+    except (etree.ParserError, ValueError):
+        soup = BeautifulSoup(html, "lxml")
+        for tag in soup.find_all(set(VISIBLE_TAGS)):
+            yield tag.get_text(separator=" ", strip=True)
+
+def extract_visible_text(html: str | bytes, max_chars: int = 5000) -> str:
     """Extrae texto visible básico para análisis de sentimiento."""
-    soup = BeautifulSoup(html, "html.parser")
     parts = []
     total = 0
-    for tag in soup.find_all(VISIBLE_TAGS):
-        t = tag.get_text(separator=" ", strip=True)
+    for t in _visible_blocks(html):
         if t:
             parts.append(t)
             total += len(t)
         if total > max_chars * 1.2:
             break
     text = " ".join(parts)
-    text = re.sub(r"\s+", " ", text).strip()
+    text = WHITESPACE_RE.sub(" ", text).strip()
     return text[:max_chars]
 
 def download_html(url: str) -> str:
     """Descarga HTML de manera tolerante; devuelve '' si falla o no es HTML."""
     try:
-        if not is_probably_html(url):
-            return ""
-        resp = get_session().get(url, timeout=DEFAULT_TIMEOUT, headers={"User-Agent": UA})
-        if resp.status_code != 200:
-            return ""
-        if not resp.content or len(resp.content) < MIN_HTML_BYTES:
-            return ""
-        ctype = resp.headers.get("Content-Type", "").lower()
-        if "html" not in ctype and ctype != "":
-            return ""
-        resp.encoding = resp.encoding or "utf-8"
-        return resp.text or resp.content.decode("utf-8", errors="ignore")
+        with host_slot(url), session.get(url, timeout=DEFAULT_TIMEOUT, headers={"User-Agent": UA}, stream=True) as resp:
+            if resp.status_code != 200 or not is_html_response(resp):
+                return ""
+            # Lectura acotada a MAX_HTML_BYTES: el texto útil para el sentimiento está al principio
+            buf = bytearray()
+            for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_BYTES):
+                buf.extend(chunk)
+                if len(buf) >= MAX_HTML_BYTES:
+                    break
+            if len(buf) < MIN_HTML_BYTES:
+                return ""
+            try:
+                return str(buf, resp.encoding or "utf-8", errors="replace")
+            except LookupError:  # charset desconocido en el header
+                return buf.decode("utf-8", errors="ignore")
     except Exception:
         return ""
 
 from time import sleep
 SENTIMENT_LABELS = {"POSITIVO", "NEGATIVO", "NEUTRO"}
-SENT_PROMPT_TMPL = (
+SENT_TAREA = (
     "Eres un clasificador de sentimiento estricto. "
     "Clasifica el sentimiento  a la empresa IRSA o los proyectos de la empresa en el texto."
-    "Devuelve SOLO una de estas palabras EXACTAS: POSITIVO, NEGATIVO, NEUTRO.\n\n"
+)
+SENT_CRITERIOS = (
     "Criterios:\n"
     "- POSITIVO: logros, apoyo, impacto favorable, mejoras atribuidas.\n"
     "- NEGATIVO: críticas, controversias, pérdidas, impacto desfavorable, antisemitismo.\n"
     "- NEUTRO: informativo/descriptivo sin carga valorativa clara.\n\n"
-    "Texto:\n{texto}"
+)
+SENT_PROMPT_TMPL = (
+    SENT_TAREA
+    + "Devuelve SOLO una de estas palabras EXACTAS: POSITIVO, NEGATIVO, NEUTRO.\n\n"
+    + SENT_CRITERIOS
+    + "Texto:\n{texto}"
+)
+# Varias notas en un solo generate_content (menos requests y menos tokens de preámbulo)
+SENT_BATCH_PROMPT_TMPL = (
+    SENT_TAREA
+    + " Vas a recibir varias noticias, cada una precedida por su [id]. "
+    "Devuelve SOLO un array JSON con un objeto por noticia, por ejemplo: "
+    '[{{"id": 1, "sentiment": "NEUTRO"}}]. sentiment debe ser POSITIVO, NEGATIVO o NEUTRO.\n\n'
+    + SENT_CRITERIOS
+    + "Noticias:\n{noticias}"
 )
 
-def analizar_noticia(url: str, *, retries: int = 3) -> str:
-    """Devuelve POSITIVO/NEGATIVO/NEUTRO. Falla segura a NEUTRO."""
+MIN_SENTIMENT_TEXT_CHARS = 120  # menos que esto suele ser una página JS sin contenido
+# El tono hacia una sola entidad se define en el copete/primeros párrafos: menos tokens por nota
+SENTIMENT_MAX_CHARS = int(os.getenv("SENTIMENT_MAX_CHARS", "1500"))
+
+# Salida estructurada para el lote: Gemini devuelve JSON válido con etiquetas del enum
+SENT_BATCH_GENERATION_CONFIG = genai.types.GenerationConfig(
+    temperature=0,
+    response_mime_type="application/json",
+    response_schema={
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "integer"},
+                "sentiment": {"type": "string", "format": "enum", "enum": sorted(SENTIMENT_LABELS)},
+            },
+            "required": ["id", "sentiment"],
+        },
+    },
+)
+
+def obtener_texto_noticia(url: str) -> str:
+    """Etapa 1 (solo red): descarga la nota y extrae texto visible. '' si no sirve."""
     try:
+        # Si la verificación ya bajó la página entera (o alcanza para el tope de texto), no se repite la descarga
+        cached = pop_page_html(url)
+        if cached:
+            content, complete = cached
+            texto = extract_visible_text(content, max_chars=SENTIMENT_MAX_CHARS)
+            if complete or len(texto) >= SENTIMENT_MAX_CHARS:
+                return texto if len(texto) >= MIN_SENTIMENT_TEXT_CHARS else ""
+
         html = download_html(url)
         if not html:
             # Loguea si el HTML no se pudo descargar
             log.info(f"Análisis NEUTRO (HTML vacío o descarga fallida): {url}")
-            return "NEUTRO"
-            
-        texto = extract_visible_text(html, max_chars=5000)
-        if not texto or len(texto) < 120:
+            return ""
+
+        texto = extract_visible_text(html, max_chars=SENTIMENT_MAX_CHARS)
+        if len(texto) < MIN_SENTIMENT_TEXT_CHARS:
             # Loguea si el texto es muy corto (probable JS)
             log.info(f"Análisis NEUTRO (Texto extraído muy corto: {len(texto)} chars): {url}")
+            return ""
+        return texto
+    except Exception as e:
+        log.warning(f"Análisis NEUTRO (Error procesando {url}): {e}")
+        return ""
+
+def clasificar_sentimiento(texto: str, url: str = "", *, retries: int = 3) -> str:
+    """Etapa 2 (Gemini): POSITIVO/NEGATIVO/NEUTRO para un texto ya extraído."""
+    log.info(f"Llamando a Gemini para: {url}")
+    prompt = SENT_PROMPT_TMPL.format(texto=texto)
+
+    for attempt in range(retries):
+        try:
+            resp = model.generate_content(prompt)
+            out = (resp.text or "").strip().upper()
+            m = re.search(r"[A-ZÁÉÍÓÚÜÑ]+", out)  # tomar la primera palabra alfabética
+            label = m.group(0) if m else out
+
+            final_label = label if label in SENTIMENT_LABELS else "NEUTRO"
+
+            # Loguea el resultado de Gemini
+            log.info(f"Gemini devolvió: {final_label} (raw: '{out[:50]}...')")
+            return final_label
+
+        except Exception as e:
+            if attempt < retries - 1:
+                sleep(1.5 * (2 ** attempt))
+                continue
+            # Loguea si Gemini falló
+            log.warning(f"Análisis NEUTRO (Error de Gemini en {url}): {e}")
             return "NEUTRO"
+    return "NEUTRO"
 
-        # Si llegamos aquí, SÍ vamos a llamar a Gemini
-        log.info(f"Llamando a Gemini para: {url}")
-        prompt = SENT_PROMPT_TMPL.format(texto=texto)
+JSON_ARRAY_RE = re.compile(r"\[.*\]", re.DOTALL)
 
-        for attempt in range(retries):
+def parse_batch_labels(raw: str) -> Dict[int, str]:
+    """{id: etiqueta} desde la respuesta JSON del lote; {} si no se puede parsear."""
+    m = JSON_ARRAY_RE.search(raw or "")
+    if not m:
+        return {}
+    try:
+        data = json.loads(m.group(0))
+    except ValueError:
+        return {}
+    labels = {}
+    for item in data if isinstance(data, list) else []:
+        if isinstance(item, dict) and "id" in item:
             try:
-                resp = model.generate_content(prompt)
-                out = (resp.text or "").strip().upper()
-                m = re.search(r"[A-ZÁÉÍÓÚÜÑ]+", out)  # tomar la primera palabra alfabética
-                label = m.group(0) if m else out
-                
-                final_label = label if label in SENTIMENT_LABELS else "NEUTRO"
-                
-                # Loguea el resultado de Gemini
-                log.info(f"Gemini devolvió: {final_label} (raw: '{out[:50]}...')")
-                return final_label
-                
-            except Exception as e:
-                if attempt < retries - 1:
-                    sleep(1.5 * (2 ** attempt))
-                    continue
-                # Loguea si Gemini falló
-                log.warning(f"Análisis NEUTRO (Error de Gemini en {url}): {e}")
-                return "NEUTRO"
+                labels[int(item["id"])] = str(item.get("sentiment", "")).strip().upper()
+            except (TypeError, ValueError):
+                continue
+    return labels
 
-    except Exception as e:
-        # Loguea si hubo un error general
-        log.warning(f"Análisis NEUTRO (Error procesando {url}): {e}")
-        return "NEUTRO"
+def clasificar_sentimientos_lote(lote: List[tuple], *, retries: int = 3) -> Dict[str, str]:
+    """
+    Un solo generate_content para varias (url, texto). Si el lote respondió, las
+    notas que no vuelvan con una etiqueta válida se clasifican de a una con
+    clasificar_sentimiento; si el lote falló (p.ej. 429/cuota), todo queda NEUTRO
+    para no multiplicar las llamadas contra una API que ya está limitando.
+    """
+    noticias = "\n\n".join(f"[{i}]\n{texto}" for i, (_, texto) in enumerate(lote, 1))
+    prompt = SENT_BATCH_PROMPT_TMPL.format(noticias=noticias)
+    labels: Optional[Dict[int, str]] = None
+    for attempt in range(retries):
+        try:
+            resp = model.generate_content(prompt, generation_config=SENT_BATCH_GENERATION_CONFIG)
+            labels = parse_batch_labels(resp.text or "")
+            break
+        except Exception as e:
+            if attempt < retries - 1:
+                sleep(1.5 * (2 ** attempt))
+                continue
+            log.warning(f"Gemini falló para un lote de {len(lote)} notas: {e}")
+
+    if labels is None:
+        return {url: "NEUTRO" for url, _ in lote}
+
+    out = {}
+    for i, (url, texto) in enumerate(lote, 1):
+        label = labels.get(i)
+        out[url] = label if label in SENTIMENT_LABELS else clasificar_sentimiento(texto, url)
+    return out
 
 # ---------------------------
 # Utilitarios Google Sheets (con backoff)
@@ -332,7 +533,8 @@ def with_backoff(fn: Callable, *, retries: int = 5, base_wait: float = 1.0, on_r
         except HttpError as e:
             status = getattr(e.resp, "status", None)
             if status in (429, 500, 502, 503, 504) and attempt < retries - 1:
-                wait = base_wait * (2 ** attempt)
+                hinted = retry_after_seconds(e)
+                wait = hinted if hinted is not None else min(RETRY_MAX_DELAY, base_wait * (2 ** attempt))
                 if on_retry:
                     log.warning(f"{on_retry} -> retry {attempt+1}/{retries} en {wait:.1f}s (HTTP {status})")
                 time.sleep(wait)
@@ -342,83 +544,106 @@ def with_backoff(fn: Callable, *, retries: int = 5, base_wait: float = 1.0, on_r
 # ---------------------------
 # Scrape con Apify -> DataFrame
 # ---------------------------
-def run_apify_queries(queries: List[str]) -> List[pd.DataFrame]:
-    """
-    Ejecuta el actor de Google News por cada query (sin restricción geográfica).
-    """
-    all_dfs: List[pd.DataFrame] = []
-    for query in queries:
-        run_input = {
-            "hl": "es-419",      # interfaz en español latino
-            "lr": "lang_es",    # resultados en español
-            "maxItems": 300,
-            "query": query,
-            "time_period": "last_hour",  # podés cambiar a "last_24_hours" si querés mayor ventana
-        }
-
-        log.info(f"Ejecutando {ACTOR_ID} con query '{query}' (sin filtro de país)...")
-        try:
-            run = apify_client.actor(ACTOR_ID).call(run_input=run_input)
-        except Exception as e:
-            log.error(f"No se pudo ejecutar actor con '{query}': {e}")
-            continue
+def _run_query(query: str) -> List[dict]:
+    """Una corrida del actor para una query; [] si falla o no trae resultados."""
+    run_input = {
+        "hl": "es-419",      # interfaz en español latino
+        "lr": "lang_es",    # resultados en español
+        "maxItems": 300,
+        "query": query,
+        "time_period": "last_hour",  # podés cambiar a "last_24_hours" si querés mayor ventana
+    }
+
+    log.info(f"Ejecutando {ACTOR_ID} con query '{query}' (sin filtro de país)...")
+    try:
+        run = apify_client.actor(ACTOR_ID).call(run_input=run_input)
+    except Exception as e:
+        log.error(f"No se pudo ejecutar actor con '{query}': {e}")
+        return []
 
-        dataset_id = run.get("defaultDatasetId")
-        if not dataset_id:
-            log.warning(f"Sin dataset para '{query}'")
-            continue
+    dataset_id = run.get("defaultDatasetId")
+    if not dataset_id:
+        log.warning(f"Sin dataset para '{query}'")
+        return []
 
-        try:
-            items = list_all_items(dataset_id)
-        except Exception as e:
-            log.error(f"No se pudo listar dataset {dataset_id}: {e}")
-            continue
-
-        if not items:
-            log.info(f"Sin resultados - '{query}'")
-            continue
-
-        df = pd.DataFrame(items)
-        if "link" not in df.columns:
-            log.warning("Dataset sin columna 'link'; se omite.")
-            continue
-
-        # Normalizaciones + dedupe
-        df["link"] = df["link"].astype(str).map(canonical_url)
-        df.drop_duplicates(subset=["link"], inplace=True)
-
-        # Asegurar "source"
-        df = ensure_source_column(df)
-
-        # Timestamps
-        now_utc = datetime.now(timezone.utc)
-        if "date_utc" in df.columns:
-            dt = pd.to_datetime(df["date_utc"], utc=True, errors="coerce")
-            df["date_utc"] = dt.dt.strftime("%d/%m/%Y")
-        else:
-            df["date_utc"] = ""
+    try:
+        items = list_all_items(dataset_id)
+    except Exception as e:
+        log.error(f"No se pudo listar dataset {dataset_id}: {e}")
+        return []
 
-        # scraped_at -> local AR dd/mm/YYYY HH:MM
-        df["scraped_at"] = now_utc.astimezone(TZ_ARG).strftime("%d/%m/%Y %H:%M")
+    if not items:
+        log.info(f"Sin resultados - '{query}'")
+        return []
 
-        # --- INICIO DE LA MODIFICACIÓN ---
-        # sentiment placeholder si no viene
-        if "sentiment" not in df.columns:
-            df["sentiment"] = ""
-        else:
-            # Si Apify trae la columna (ej. como 'null'), forzarla a string
-            # y rellenar/reemplazar Nones o "nan" para que el Step 5 la detecte como vacía.
-            df["sentiment"] = df["sentiment"].astype(str).fillna("").replace("None", "").replace("nan", "")
-        # --- FIN DE LA MODIFICACIÓN ---
+    return items
 
-        all_dfs.append(df)
+def run_apify_queries(queries: List[str]) -> pd.DataFrame:
+    """
+    Ejecuta el actor de Google News por cada query (sin restricción geográfica)
+    y devuelve un único DataFrame con los resultados de todas las queries.
+    """
+    # scraped_at -> local AR dd/mm/YYYY HH:MM, uno solo para toda la corrida
+    scraped_at = datetime.now(timezone.utc).astimezone(TZ_ARG).strftime("%d/%m/%Y %H:%M")
+    # Las corridas del actor son remotas y bloqueantes: todas las queries a la vez
+    # (el tiempo total es el de la más lenta, no la suma). map conserva el orden
+    # de las queries para que el dedupe posterior quede igual.
+    all_items: List[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, len(queries))) as ex:
+        for items in ex.map(_run_query, queries):
+            all_items.extend(items)
+
+    # Un solo DataFrame para todas las queries: normalizaciones una sola vez
+    df = pd.DataFrame.from_records(all_items)
+    if df.empty or "link" not in df.columns:
+        if not df.empty:
+            log.warning("Datasets sin columna 'link'; se omiten.")
+        return pd.DataFrame()
+
+    # Normalizaciones + dedupe (filas sin link se descartan)
+    df = df[df["link"].notna()].copy()
+    # canonical_url una vez por link distinto (las queries repiten muchas notas)
+    links = df["link"].astype(str)
+    canon = {u: canonical_url(u) for u in links.unique()}
+    df["link"] = links.map(canon)
+    df.drop_duplicates(subset=["link"], inplace=True)
+
+    # Asegurar "source"
+    df = ensure_source_column(df)
+
+    # Timestamps
+    if "date_utc" in df.columns:
+        # fecha local AR; dd/mm/YYYY armado con componentes vectorizados (dt.strftime va fila por fila)
+        dt = pd.to_datetime(df["date_utc"], utc=True, errors="coerce").dt.tz_convert(TZ_ARG)
+        valid = dt.notna()
+        out = pd.Series("", index=df.index, dtype=object)
+        d = dt[valid]
+        out[valid] = (
+            d.dt.day.astype(str).str.zfill(2) + "/"
+            + d.dt.month.astype(str).str.zfill(2) + "/"
+            + d.dt.year.astype(str)
+        )
+        df["date_utc"] = out
+    else:
+        df["date_utc"] = ""
 
-    return all_dfs
+    df["scraped_at"] = scraped_at
+
+    # --- INICIO DE LA MODIFICACIÓN ---
+    # sentiment placeholder si no viene
+    if "sentiment" not in df.columns:
+        df["sentiment"] = ""
+    else:
+        # Si Apify trae la columna (ej. como 'null'), forzarla a string
+        # y rellenar/reemplazar Nones o "nan" para que el Step 5 la detecte como vacía.
+        df["sentiment"] = df["sentiment"].astype(str).fillna("").replace("None", "").replace("nan", "")
+    # --- FIN DE LA MODIFICACIÓN ---
+
+    return df
 
 # ---------------------------
 # Filtro por contenido (HTTP en paralelo)
 # ---------------------------
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 def filter_by_content(prefiltered: pd.DataFrame) -> pd.DataFrame:
     links = prefiltered["link"].dropna().astype(str).tolist()
@@ -427,7 +652,8 @@ def filter_by_content(prefiltered: pd.DataFrame) -> pd.DataFrame:
         log.warning("No hay links para verificar en sitio.")
         return prefiltered.copy()
 
-    max_workers = max(4, min(MAX_THREADS_HARD, (n // 6) + 1))
+    # un hilo por URL hasta el techo: el tiempo se va en esperar a cada sitio
+    max_workers = max(1, min(MAX_THREADS_HARD, n))
     log.info(f"Verificando contenido en sitio (threads={max_workers}, {n} urls)...")
 
     results: Dict[str, bool] = {}
@@ -444,80 +670,104 @@ def filter_by_content(prefiltered: pd.DataFrame) -> pd.DataFrame:
 
     return prefiltered[prefiltered["link"].map(results).fillna(False)].copy()
 
+def score_sentiments(links: List[str]) -> Dict[str, str]:
+    """
+    Sentimiento por link único en dos etapas:
+      1) descarga + extracción de texto con el pool de red (hasta MAX_THREADS_HARD hilos);
+      2) Gemini solo para los textos útiles, en lotes de SENTIMENT_BATCH_SIZE notas
+         y acotado a SENTIMENT_WORKERS llamadas concurrentes (cuota).
+    """
+    unique_links = list(dict.fromkeys(links))
+    if not unique_links:
+        return {}
+
+    fetch_workers = max(1, min(MAX_THREADS_HARD, len(unique_links)))
+    log.info(f"Descargando texto para sentimiento (threads={fetch_workers}, {len(unique_links)} urls)...")
+    with ThreadPoolExecutor(max_workers=fetch_workers) as ex:
+        textos = dict(zip(unique_links, ex.map(obtener_texto_noticia, unique_links)))
+
+    results = {u: "NEUTRO" for u in unique_links}
+    to_score = [u for u in unique_links if textos[u]]
+    if not to_score:
+        return results
+
+    size = max(1, SENTIMENT_BATCH_SIZE)
+    lotes = [
+        [(u, textos[u]) for u in to_score[i:i + size]]
+        for i in range(0, len(to_score), size)
+    ]
+    workers = max(1, min(SENTIMENT_WORKERS, len(lotes)))
+    log.info(f"Sentimiento Gemini (threads={workers}, {len(to_score)} urls en {len(lotes)} lotes)...")
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for labels in ex.map(clasificar_sentimientos_lote, lotes):
+            results.update(labels)
+    return results
+
 # ---------------------------
 # Google Sheets IO
 # ---------------------------
-def ensure_headers() -> pd.DataFrame:
-    read_range = f"{SHEET_TAB}!A:G"
-    log.info(f"Leyendo hoja existente: {read_range} ...")
+def _col_letter(idx: int) -> str:
+    return chr(ord("A") + idx)
 
-    try:
+def load_existing_links() -> tuple[set, bool]:
+    """
+    Devuelve (links ya cargados, hoja_vacía). Solo se leen el encabezado y la
+    columna "link" en un único batchGet: no hace falta bajar toda la hoja ni
+    armar un DataFrame para chequear pertenencia.
+    """
+    link_col = _col_letter(HEADER.index("link"))
+    ranges = [f"{SHEET_TAB}!1:1", f"{SHEET_TAB}!{link_col}2:{link_col}"]
+    log.info(f"Leyendo encabezado + columna de links: {ranges} ...")
+
+    def _batch_get(rngs: List[str]) -> List[list]:
         result = with_backoff(
-            lambda: sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=read_range).execute(),
+            lambda: sheet.values().batchGet(spreadsheetId=SPREADSHEET_ID, ranges=rngs).execute(),
             on_retry="Lectura de Google Sheets",
         )
-        values = result.get("values", [])
-    except Exception as e:
-        log.warning(f"No se pudo leer la hoja (se asumirá vacía): {e}")
-        values = []
-
-    if not values:
-        log.info("Hoja vacía, creando encabezados...")
-        with_backoff(
-            lambda: sheet.values().update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=f"{SHEET_TAB}!A1",
-                valueInputOption="RAW",
-                body={"values": [HEADER]},
-            ).execute(),
-            on_retry="Creación de encabezados",
-        )
-        return pd.DataFrame(columns=HEADER)
+        return [vr.get("values", []) for vr in result.get("valueRanges", [])] + [[]] * len(rngs)
 
-    # --- INICIO DE LA MODIFICACIÓN ---
-    # Lógica robusta para manejar filas incompletas
-    
-    header_in_sheet = values[0]
-    rows = values[1:] if len(values) > 1 else []
-    
     try:
-        # Intento normal y rápido
-        existing_df = pd.DataFrame(rows, columns=header_in_sheet)
-    
-    except (ValueError, AssertionError):
-        # Fallback: El error "X columns passed, passed data had Y columns"
-        log.warning(f"Detectadas filas incompletas en Google Sheet (encabezado={len(header_in_sheet)}, datos variables). Se normalizarán.")
-        
-        # Usa el encabezado de la hoja (que puede tener 6 o 7 cols)
-        num_cols_header = len(header_in_sheet)
-        data_normalizada = []
-        
-        for row in rows:
-            # Asegura que cada fila tenga exactamente 'num_cols_header'
-            # Rellena con "" si es más corta, la trunca si es más larga.
-            padded_row = (list(row) + [""] * num_cols_header)[:num_cols_header]
-            data_normalizada.append(padded_row)
-        
-        # Crea el DataFrame con los datos limpios
-        existing_df = pd.DataFrame(data_normalizada, columns=header_in_sheet)
-    
-    # --- FIN DE LA MODIFICACIÓN ---
+        header_vals, link_vals = _batch_get(ranges)[:2]
+    except Exception as e:
+        # Sin lectura no sabemos si hay encabezado: no lo agregamos para no duplicarlo
+        log.warning(f"No se pudo leer la hoja (se asumirá vacía): {e}")
+        return set(), False
+
+    header_in_sheet = header_vals[0] if header_vals else []
+    if not header_in_sheet and not link_vals:
+        # El encabezado se escribe junto con las filas nuevas (una sola llamada)
+        log.info("Hoja vacía, se escribirán encabezados con el primer append.")
+        return set(), True
+
+    if "link" not in header_in_sheet:
+        return set(), False
+    sheet_idx = header_in_sheet.index("link")
+    if sheet_idx != HEADER.index("link"):
+        # La hoja tiene otro orden de columnas: se relee la columna correcta
+        col = _col_letter(sheet_idx)
+        try:
+            link_vals = _batch_get([f"{SHEET_TAB}!{col}2:{col}"])[0]
+        except Exception as e:
+            log.warning(f"No se pudo leer la columna de links: {e}")
+            return set(), False
 
-    # El resto de la función original sigue:
-    # Se asegura de que las 7 columnas que QUEREMOS existan
-    for col in HEADER:
-        if col not in existing_df.columns:
-            existing_df[col] = ""
-    # Reordena/filtra para que solo queden las 7 columnas del HEADER
-    existing_df = existing_df.reindex(columns=HEADER, fill_value="")
-    return existing_df
+    existing = {str(r[0]) for r in link_vals if r}
+    existing.discard("")
+    return existing, False
 
+def cell_to_str(v) -> str:
+    if v is None or (isinstance(v, float) and v != v):  # None / NaN -> celda vacía
+        return ""
+    return v if isinstance(v, str) else str(v)
 
-def append_new_rows(new_rows: pd.DataFrame) -> None:
-    if new_rows.empty:
+def append_new_rows(new_rows: pd.DataFrame, with_header: bool = False) -> None:
+    if new_rows.empty and not with_header:
         log.info("No hay filas nuevas para agregar.")
         return
     log.info(f"Agregando {len(new_rows)} filas nuevas...")
+    # Filas armadas directo desde el array de objetos (sin copiar el DataFrame con astype(str))
+    values = [HEADER] if with_header else []
+    values.extend([cell_to_str(v) for v in row] for row in new_rows.to_numpy(dtype=object))
 
     with_backoff(
         lambda: sheet.values().append(
@@ -525,7 +775,7 @@ def append_new_rows(new_rows: pd.DataFrame) -> None:
             range=f"{SHEET_TAB}!A1",
             valueInputOption="USER_ENTERED",  # 👈 cambio clave
             insertDataOption="INSERT_ROWS",
-            body={"values": new_rows.astype(str).values.tolist()},
+            body={"values": values},
         ).execute(),
         on_retry="Append a Google Sheets",
     )
@@ -536,34 +786,37 @@ def append_new_rows(new_rows: pd.DataFrame) -> None:
 # ---------------------------
 def run_pipeline() -> None:
     # 1) Scrape
-    all_dfs = run_apify_queries(QUERIES)
-    if not all_dfs:
+    # 2) Combinado + dedupe (ya resueltos en run_apify_queries)
+    final_df = run_apify_queries(QUERIES)
+    if final_df.empty:
         log.error("No se obtuvieron resultados de ningún país/query.")
         return
 
-    # 2) Combine + dedupe
-    final_df = pd.concat(all_dfs, ignore_index=True)
-    final_df.drop_duplicates(subset=["link"], inplace=True)
-
-
-    # 3) Prefiltro por título/snippet
-    if not final_df.empty:
-        mask_pref = final_df.apply(prefilter_row_mentions, axis=1)
-        prefiltered = final_df[mask_pref].copy()
-        if prefiltered.empty:
-            prefiltered = final_df.copy()
+    # 2b) Links ya cargados (solo encabezado + columna link), leídos ANTES de
+    #     verificar: las notas que ya están en la hoja no se piden a la web ni
+    #     pasan por Gemini (no se agregarían de nuevo)
+    existing_links, needs_header = load_existing_links()
+    nuevas = ~final_df["link"].isin(existing_links)  # link ya es str canónico
+    if not nuevas.all():
+        log.info(f"{int((~nuevas).sum())} notas ya están en la hoja; se omiten.")
+
+
+    # 3) Prefiltro por título/snippet: si el nombre ya aparece ahí, la nota
+    #    se acepta sin verificar la página (sin requests)
+    mask_pref = prefilter_mentions(final_df)
+    if mask_pref.any():
+        log.info(f"Prefiltro: {int(mask_pref.sum())} notas mencionan el nombre en título/snippet; sin verificación web.")
+        filtered = final_df[mask_pref & nuevas].copy()
     else:
-        prefiltered = final_df
-
-    # 4) Filtro por contenido (requests en paralelo)
-    filtered = filter_by_content(prefiltered)
+        # 4) Ninguna lo menciona en título/snippet: filtro por contenido (requests en paralelo)
+        filtered = filter_by_content(final_df[nuevas].copy())
     if filtered.empty:
         log.warning("Tras el filtro de contenido, no quedaron resultados relevantes.")
-        # Nota: aunque esté vacío, continuamos para leer la hoja
-        # y asegurarnos de que los encabezados estén allí.
+        # Nota: aunque esté vacío, continuamos para
+        # asegurarnos de que los encabezados estén en la hoja.
         # Si no, la próxima ejecución podría fallar.
 
-    # 5) Sentimiento con Gemini (solo si la columna existe/viene vacía)
+    # 5) Sentimiento con Gemini (solo filas nuevas y con la columna vacía)
     if "sentiment" not in filtered.columns:
         filtered["sentiment"] = ""
     
@@ -572,28 +825,20 @@ def run_pipeline() -> None:
     
     if mask_to_score.any():
         log.info(f"Calculando sentimiento Gemini para {mask_to_score.sum()} notas...")
-        # Por estabilidad de cuota, lo hacemos secuencial; si querés, podés paralelizar con 3-4 workers.
-        filtered.loc[mask_to_score, "sentiment"] = (
-            filtered.loc[mask_to_score, "link"].astype(str).apply(analizar_noticia)
-        )
+        # En paralelo acotado (SENTIMENT_WORKERS) para no pasarnos de cuota
+        links_to_score = filtered.loc[mask_to_score, "link"].astype(str)
+        sentiments = score_sentiments(links_to_score.tolist())
+        filtered.loc[mask_to_score, "sentiment"] = links_to_score.map(sentiments).fillna("NEUTRO")
 
     # 6) Asegurar columnas, tipos y orden final (exactamente 7)
     for col in HEADER:
         if col not in filtered.columns:
             filtered[col] = ""
-    final_out = filtered.astype({c: str for c in filtered.columns}).reindex(columns=HEADER, fill_value="")
-
-    # 7) Leer hoja/encabezados
-    existing_df = ensure_headers()
-
-    # 8) Append SOLO filas nuevas (por link)
-    if existing_df.empty:
-        new_rows = final_out
-    else:
-        new_rows = final_out.loc[~final_out["link"].isin(existing_df["link"])]
+    # 7) Solo quedan filas nuevas (por link)
+    new_rows = filtered.reindex(columns=HEADER, fill_value="")
 
-    # 9) Append
-    append_new_rows(new_rows)
+    # 8) Append
+    append_new_rows(new_rows, with_header=needs_header)
 
 if __name__ == "__main__":
     run_pipeline()